@@ -0,0 +1,15 @@
+import os
+
+# The settings are read at import time, so give the benchmarks something to load when there is no .env
+os.environ.setdefault("DISCORD_TOKEN", "benchmark")
+os.environ.setdefault("DISCORD_GUILD_ID", "1")
+os.environ.setdefault("PINECONE_API_KEY", "benchmark")
+os.environ.setdefault("SUPABASE_API_URL", "http://127.0.0.1:1")
+os.environ.setdefault("SUPABASE_API_KEY", "benchmark.benchmark.benchmark")
+
+# Keep the benchmarks self-contained and measure our own code, not Discord's rate limits
+os.environ.setdefault("OUTBOX_PATH", ":memory:")
+os.environ.setdefault("SNAPSHOT_PATH", ":memory:")
+os.environ.setdefault("NOTIFICATION_DIGEST_WINDOW", "0")
+os.environ.setdefault("DM_RATE_PER_SECOND", "1000000")
+os.environ.setdefault("DM_BURST", "1000000")
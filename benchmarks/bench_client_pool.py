@@ -0,0 +1,69 @@
+"""
+Compares the per-call latency of building a new Supabase client for every request (the old behaviour)
+against the shared, pooled client, using a local PostgREST stand-in.
+
+    python -m benchmarks.bench_client_pool --calls 200
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from supabase._async.client import create_client
+
+from benchmarks.fake_postgrest import FakePostgrest
+from discordbot.models.user_models import User
+from discordbot.store.supabase_manager import SupabaseManager
+from discordbot.store.supabase_pool import SupabaseClientPool
+
+
+class UnpooledManager(SupabaseManager):
+    """
+    A manager that creates a client for every call, like SupabaseManager did before it was pooled
+    """
+
+    async def client(self):
+        return await create_client(self.api_url, self.api_key)
+
+
+async def measure(manager: SupabaseManager, calls: int):
+    timings = []
+    for i in range(calls):
+        start = time.perf_counter()
+        await manager.query(User.key(1, i % 10))
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name: str, timings, server: FakePostgrest):
+    timings_ms = sorted(t * 1000 for t in timings)
+    p95 = timings_ms[int(len(timings_ms) * 0.95) - 1]
+    print(f"{name:>10}: mean {statistics.mean(timings_ms):7.3f} ms  "
+          f"p50 {statistics.median(timings_ms):7.3f} ms  p95 {p95:7.3f} ms  "
+          f"tcp connections {server.connections}")
+
+
+async def main(calls: int, latency: float):
+    async with FakePostgrest(latency=latency) as server:
+        server.seed("users", [
+            User(id=User.key(1, i), guild_id="1", is_ping_hour_before=True, is_ping_day_before=False).model_dump(mode="json")
+            for i in range(10)
+        ])
+        api_key = "benchmark.benchmark.benchmark"
+
+        unpooled = UnpooledManager("users", User, api_url=server.url, api_key=api_key)
+        report("unpooled", await measure(unpooled, calls), server)
+
+        server.reset_counters()
+        pool = SupabaseClientPool(server.url, api_key)
+        pooled = SupabaseManager("users", User, api_url=server.url, api_key=api_key, pool=pool)
+        report("pooled", await measure(pooled, calls), server)
+        await pool.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated server latency in seconds")
+    args = parser.parse_args()
+    asyncio.run(main(args.calls, args.latency))
@@ -0,0 +1,78 @@
+"""
+Measures how long it takes a standby replica to take over as the leader, when the leader crashes and when it
+shuts down cleanly, and checks that the old leader's fenced writes are rejected afterwards.
+
+    python -m benchmarks.bench_failover --ttl 3
+
+The replicas share an in-memory lease backend, and the fenced writes go to an in-process PostgREST stand-in.
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.fake_postgrest import FakePostgrest
+from discordbot.actions.leader_elector import LeaderElector
+from discordbot.models.event_models import Event
+from discordbot.store.leases import MemoryLeaseBackend
+from discordbot.store.supabase_manager import SupabaseManager
+from discordbot.store.supabase_pool import SupabaseClientPool
+
+API_KEY = "benchmark.benchmark.benchmark"
+
+
+async def takeover(ttl: float, clean: bool) -> float:
+    """
+    :return: Seconds between the leader going away and the standby becoming the leader
+    """
+    backend = MemoryLeaseBackend()
+    leader = LeaderElector(backend, holder="leader", ttl=ttl)
+    standby = LeaderElector(backend, holder="standby", ttl=ttl)
+    await leader.step()
+    tasks = [asyncio.create_task(leader.run()), asyncio.create_task(standby.run())]
+    await asyncio.sleep(ttl)
+    assert leader.is_leader and not standby.is_leader
+
+    tasks[0].cancel()
+    if clean:
+        await leader.release()
+    gone = time.monotonic()
+    while not standby.is_leader:
+        await asyncio.sleep(0.01)
+    elapsed = time.monotonic() - gone
+    tasks[1].cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return elapsed
+
+
+async def fencing(ttl: float) -> bool:
+    """
+    :return: Whether the old leader's write was rejected once the new leader had written
+    """
+    async with FakePostgrest() as server:
+        server.seed("events", [{"id": "1", "already_notified_24_hours": False, "fence": 0}])
+        pool = SupabaseClientPool(server.url, API_KEY)
+        manager = SupabaseManager("events", Event, api_url=server.url, api_key=API_KEY, pool=pool)
+
+        backend = MemoryLeaseBackend()
+        old = await backend.acquire("leader", "old", ttl)
+        backend.leases["leader"] = old.model_copy(update={"expires_at": 0})  # The old leader stalls
+        new = await backend.acquire("leader", "new", ttl)
+
+        accepted = await manager.patch_fenced("1", {"already_notified_24_hours": True}, new.token)
+        rejected = await manager.patch_fenced("1", {"already_notified_24_hours": False}, old.token)
+        await pool.close()
+        return accepted is not None and rejected is None and server.tables["events"]["1"]["fence"] == new.token
+
+
+async def main(ttl: float):
+    print(f"Lease ttl {ttl}s, renewed every {ttl / 3:.1f}s")
+    print(f"crash:    standby took over in {await takeover(ttl, clean=False):.2f}s")
+    print(f"shutdown: standby took over in {await takeover(ttl, clean=True):.2f}s")
+    print(f"fencing:  stale leader's write {'rejected' if await fencing(ttl) else 'ACCEPTED'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ttl", type=float, default=3, help="Seconds the leader lease lasts unless renewed")
+    args = parser.parse_args()
+    asyncio.run(main(args.ttl))
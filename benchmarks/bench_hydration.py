@@ -0,0 +1,51 @@
+"""
+Compares the per-row cost and memory footprint of hydrating User rows with full validation (the old
+behaviour), pydantic's model_construct, and the trusted-read fast path.
+
+    python -m benchmarks.bench_hydration --rows 50000
+"""
+import argparse
+import time
+import tracemalloc
+from typing import Callable
+
+from discordbot.models.user_models import User
+from discordbot.store.supabase_manager import SupabaseManager
+from discordbot.store.supabase_pool import SupabaseClientPool
+
+
+def measure(hydrate: Callable[[dict], User], rows):
+    start = time.perf_counter()
+    hydrated = [hydrate(row) for row in rows]
+    elapsed = time.perf_counter() - start
+    del hydrated
+
+    tracemalloc.start()
+    retained = [hydrate(row) for row in rows]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del retained
+    return elapsed, size
+
+
+def main(row_count: int):
+    rows = [
+        {"id": User.key(1, i), "guild_id": "1", "created_at": 1_700_000_000 + i, "is_ping_hour_before": i % 2 == 0, "is_ping_day_before": i % 3 == 0}
+        for i in range(row_count)
+    ]
+    pool = SupabaseClientPool()
+    approaches = {
+        "validated": SupabaseManager("users", User, pool=pool, trusted_reads=False).hydrate,
+        "construct": lambda row: User.model_construct(**row),
+        "trusted": SupabaseManager("users", User, pool=pool, trusted_reads=True).hydrate,
+    }
+    for name, hydrate in approaches.items():
+        elapsed, size = measure(hydrate, rows)
+        print(f"{name:>10}: {elapsed * 1e6 / row_count:6.2f} us/row  {elapsed * 1000:8.1f} ms total  "
+              f"{size / row_count:6.0f} B/row  {size / 2 ** 20:6.1f} MiB total")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50_000)
+    main(parser.parse_args().rows)
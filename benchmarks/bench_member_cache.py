@@ -0,0 +1,102 @@
+"""
+Compares the memory held by the full member cache against lean mode, where only notification recipients are
+requested from Discord, by resolving one notification wave's recipients the way the outbox does.
+
+    python -m benchmarks.bench_member_cache --members 100000
+
+Both modes use real discord.py member objects. In full mode the guild is filled the way chunking at startup
+fills it. In lean mode member requests are answered locally with the same payloads the gateway would send.
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+from typing import List
+
+import discord
+
+from discordbot.settings import SETTINGS
+from discordbot.util.member_resolver import MemberResolver
+
+
+def member_payload(member_id: int) -> dict:
+    return {
+        "user": {
+            "id": str(member_id),
+            "username": f"user{member_id}",
+            "global_name": f"User {member_id}",
+            "discriminator": "0",
+            "avatar": None,
+        },
+        "roles": [],
+        "joined_at": "2024-01-01T00:00:00+00:00",
+        "deaf": False,
+        "mute": False,
+        "flags": 0,
+    }
+
+
+class LeanGuild(discord.Guild):
+    """
+    A guild whose member requests are answered locally instead of over the gateway
+    """
+
+    member_requests = 0
+
+    async def query_members(self, user_ids: List[int], limit: int = 5, cache: bool = True) -> List[discord.Member]:
+        self.member_requests += 1
+        return [discord.Member(data=member_payload(user_id), guild=self, state=self._state) for user_id in user_ids]
+
+
+async def measure(lean: bool, member_count: int, recipients: List[int], batch_size: int):
+    intents = discord.Intents.default()
+    intents.members = True
+    client = discord.Client(
+        intents=intents,
+        member_cache_flags=discord.MemberCacheFlags.none() if lean else discord.MemberCacheFlags.all()
+    )
+    state = client._connection
+
+    tracemalloc.start()
+    guild = (LeanGuild if lean else discord.Guild)(data={"id": "1", "name": "benchmark"}, state=state)
+    if not lean:
+        for member_id in range(1, member_count + 1):
+            guild._add_member(discord.Member(data=member_payload(member_id), guild=guild, state=state))
+
+    client.get_guild = lambda guild_id: guild
+    resolver = MemberResolver(client, lean=lean)
+    start = time.perf_counter()
+    resolved = 0
+    for i in range(0, len(recipients), batch_size):
+        resolved += len(await resolver.resolve(guild.id, recipients[i:i + batch_size]))
+    elapsed = time.perf_counter() - start
+
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "retained": retained,
+        "peak": peak,
+        "elapsed": elapsed,
+        "resolved": resolved,
+        "requests": getattr(guild, "member_requests", 0),
+    }
+
+
+async def main(member_count: int, subscriber_share: float, batch_size: int):
+    step = round(1 / subscriber_share)
+    recipients = list(range(step, member_count + 1, step))
+    print(f"{member_count} members, {len(recipients)} recipients, lean cache size {SETTINGS.member_cache_size}")
+    for name, lean in (("full", False), ("lean", True)):
+        result = await measure(lean, member_count, recipients, batch_size)
+        print(f"{name:>5}: {result['retained'] / 2 ** 20:7.1f} MiB retained  {result['peak'] / 2 ** 20:7.1f} MiB peak  "
+              f"{result['elapsed'] * 1000:8.1f} ms to resolve {result['resolved']}  "
+              f"{result['requests']} member requests")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=100_000)
+    parser.add_argument("--subscribers", type=float, default=1 / 3, help="Share of members that get the notification")
+    parser.add_argument("--batch-size", type=int, default=100, help="Recipients resolved at once, like the outbox")
+    args = parser.parse_args()
+    asyncio.run(main(args.members, args.subscribers, args.batch_size))
@@ -0,0 +1,234 @@
+"""
+Runs the bot's hot paths against an in-process PostgREST stand-in and a fake guild, over a sweep of
+guild sizes, and reports wall time, request count and peak memory per scenario.
+
+    python -m benchmarks.bench_suite --users 10,1000,50000 --events 5,500 --save baseline.json
+    python -m benchmarks.bench_suite --baseline baseline.json --threshold 1.5
+
+With --baseline, the run fails when a scenario makes more requests than the baseline, or its wall time or
+peak memory grows by more than --threshold times. Wall time is measured with tracemalloc running, so only
+compare runs made with this script.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import sys
+import time
+import tracemalloc
+from typing import Awaitable, Callable, Dict, List
+
+import discord
+from discord import app_commands
+
+from benchmarks.fake_discord import FakeGuild, FakeInteraction
+from benchmarks.fake_postgrest import FakePostgrest
+from discordbot.models.event_models import Event
+from discordbot.models.user_models import User
+from discordbot.store.supabase_pool import SupabaseClientPool
+from main import DiscordClient
+
+API_KEY = "benchmark.benchmark.benchmark"
+
+# How many members join, or toggle their notifications, in the burst scenarios
+BURST_SIZE = 100
+
+# How many events are coming up at once in the busy week scenario
+BUSY_EVENTS = 5
+
+# How many times each event's RSVP count changes in the gateway scenario
+RSVPS_PER_EVENT = 10
+
+
+class Harness:
+    """
+    A DiscordClient wired up to the fakes, without connecting to anything
+    """
+
+    def __init__(self, users: int, events: int, latency: float):
+        self.server = FakePostgrest(latency=latency)
+        self.guild = FakeGuild(users, events, latency=latency)
+        intents = discord.Intents.default()
+        intents.members = True
+        intents.guild_scheduled_events = True
+        self.client = DiscordClient(intents=intents)
+        self.client.get_guild = lambda guild_id: self.guild
+        self.pool: SupabaseClientPool = None
+
+    async def __aenter__(self) -> "Harness":
+        await self.server.start()
+        self.pool = SupabaseClientPool(self.server.url, API_KEY)
+        for manager in self.client.supabase_managers.values():
+            manager.pool = self.pool
+
+        # Everything was written a while ago, so only the scenarios' own writes are recent
+        written_at = time.time() - 60 * 60
+        self.server.seed("users", [
+            User(id=User.key(self.guild.id, member.id), guild_id=str(self.guild.id),
+                 is_ping_hour_before=member.id % 2 == 0, is_ping_day_before=member.id % 3 == 0,
+                 updated_at=written_at)
+            .model_dump(mode="json")
+            for member in self.guild.members
+        ])
+
+        # Most events are already known, and a few of those have changed since
+        scheduled_events = self.guild.scheduled_events
+        known = [Event.from_scheduled_event(event) for event in scheduled_events[:len(scheduled_events) * 4 // 5]]
+        for event in known:
+            event.updated_at = written_at
+        for event in known[::10]:
+            event.user_count += 1
+        self.server.seed("events", [event.model_dump(mode="json") for event in known])
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.client.event_updates.close()
+        await self.client.event_writes.close()
+        self.client.outbox.close()
+        await self.client.welcome_queue.close()
+        await self.pool.close()
+        await self.server.stop()
+
+    @property
+    def request_count(self) -> int:
+        return self.server.request_count + sum(self.guild.requests.values())
+
+    def reset_counters(self):
+        self.server.reset_counters()
+        self.guild.requests.clear()
+
+    def command(self, name: str) -> app_commands.Command:
+        return self.client.tree.get_command("notifications").get_command(name)
+
+
+async def event_sync(harness: Harness):
+    from discordbot.actions.event_action import EventAction
+
+    await EventAction(harness.client).action()
+    if harness.client.outbox._drain_task is not None:
+        await harness.client.outbox._drain_task
+
+
+async def busy_week(harness: Harness):
+    # Several events cross their 24 hour threshold in the same pass
+    soon = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=12)
+    for i, event in enumerate(harness.guild.scheduled_events[:BUSY_EVENTS]):
+        event.start_time = soon + datetime.timedelta(hours=i)
+    await event_sync(harness)
+
+
+async def steady_poll(harness: Harness):
+    # The pass after a full one, when little has changed, should only read the changes
+    from discordbot.actions.event_action import EventAction
+
+    action = EventAction(harness.client)
+    await action.action()
+    if harness.client.outbox._drain_task is not None:
+        await harness.client.outbox._drain_task
+    harness.reset_counters()
+    await action.action()
+
+
+async def gateway_updates(harness: Harness):
+    # A storm of RSVPs on every event, then one update that changes nothing we store
+    for _ in range(RSVPS_PER_EVENT):
+        for event in harness.guild.scheduled_events:
+            event.user_count += 1
+            await harness.client.on_scheduled_event_update(event, event)
+    await harness.client.event_updates.flush()
+    await harness.client.event_writes.flush()
+    for event in harness.guild.scheduled_events:
+        await harness.client.on_scheduled_event_update(event, event)
+    await harness.client.event_updates.flush()
+    await harness.client.event_writes.flush()
+
+
+async def member_joins(harness: Harness):
+    for member in harness.guild.members[:BURST_SIZE]:
+        await harness.client.on_member_join(member)
+    await harness.client.welcome_queue.flush()
+
+
+async def notification_toggles(harness: Harness):
+    hour_before = harness.command("hour_before")
+    for member in harness.guild.members[:BURST_SIZE]:
+        await hour_before.callback(FakeInteraction(member), None)
+
+
+SCENARIOS: Dict[str, Callable[[Harness], Awaitable[None]]] = {
+    "event_sync": event_sync,
+    "busy_week": busy_week,
+    "steady_poll": steady_poll,
+    "gateway_updates": gateway_updates,
+    "member_joins": member_joins,
+    "notification_toggles": notification_toggles,
+}
+
+
+async def run_scenario(scenario: Callable[[Harness], Awaitable[None]], users: int, events: int, latency: float):
+    async with Harness(users, events, latency) as harness:
+        harness.reset_counters()
+        tracemalloc.start()
+        start = time.perf_counter()
+        await scenario(harness)
+        wall = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {"wall": wall, "requests": harness.request_count, "peak": peak}
+
+
+def find_regressions(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        before = baseline[key]
+        if result["requests"] > before["requests"]:
+            regressions.append(f"{key}: requests {before['requests']} -> {result['requests']}")
+        for metric in ("wall", "peak"):
+            if result[metric] > before[metric] * threshold:
+                regressions.append(f"{key}: {metric} {before[metric]:.4g} -> {result[metric]:.4g}")
+    return regressions
+
+
+async def main(args: argparse.Namespace) -> int:
+    results = {}
+    print(f"{'scenario':<22}{'users':>8}{'events':>8}{'wall (ms)':>12}{'requests':>10}{'peak (KiB)':>12}")
+    for users in args.users:
+        for events in args.events:
+            for name, scenario in SCENARIOS.items():
+                if args.scenarios and name not in args.scenarios:
+                    continue
+                result = await run_scenario(scenario, users, events, args.latency)
+                results[f"{name}/{users}/{events}"] = result
+                print(f"{name:<22}{users:>8}{events:>8}{result['wall'] * 1000:>12.1f}"
+                      f"{result['requests']:>10}{result['peak'] / 1024:>12.0f}")
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = find_regressions(results, json.load(file), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+def int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int_list, default=[10, 1000, 50000])
+    parser.add_argument("--events", type=int_list, default=[5, 500])
+    parser.add_argument("--scenarios", type=lambda value: value.split(","), default=None)
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated network latency in seconds")
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against results saved with --save")
+    parser.add_argument("--threshold", type=float, default=1.5, help="Allowed wall time and memory growth")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,124 @@
+import asyncio
+import datetime
+from collections import Counter
+from typing import Dict, List, Optional
+
+import discord
+
+
+class FakeMember:
+    """
+    Stands in for a discord.Member. Sent DMs are counted on the guild
+    """
+
+    def __init__(self, guild: "FakeGuild", member_id: int):
+        self.guild = guild
+        self.id = member_id
+        self.mention = f"<@{member_id}>"
+
+    async def send(self, content: str):
+        self.guild.requests["send_dm"] += 1
+        if self.guild.latency:
+            await asyncio.sleep(self.guild.latency)
+
+    def __repr__(self):
+        return f"FakeMember({self.id})"
+
+
+class FakeScheduledEvent:
+    """
+    Stands in for a discord.ScheduledEvent, with the attributes the bot reads
+    """
+
+    def __init__(self, guild: "FakeGuild", event_id: int, start_time: datetime.datetime):
+        self.guild = guild
+        self.id = event_id
+        self.guild_id = guild.id
+        self.name = f"Event {event_id}"
+        self.description = f"A description of event {event_id}. " * 10
+        self.entity_type = discord.EntityType.external
+        self.entity_id = None
+        self.start_time = start_time
+        self.end_time = start_time + datetime.timedelta(hours=2)
+        self.status = discord.EventStatus.scheduled
+        self.user_count = 0
+        self.location = "Somewhere"
+
+    @property
+    def url(self) -> str:
+        return f"https://discord.com/events/{self.guild_id}/{self.id}"
+
+    async def start(self):
+        self.guild.requests["start_event"] += 1
+        self.status = discord.EventStatus.active
+
+
+class FakeGuild:
+    """
+    Stands in for a discord.Guild with `member_count` members and `event_count` scheduled events. Every call that
+    would be a REST request is counted, and can be delayed to simulate latency
+    """
+
+    def __init__(self, member_count: int, event_count: int, latency: float = 0.0, guild_id: int = 1):
+        self.id = guild_id
+        self.latency = latency
+        self.requests: Counter = Counter()
+        self._members: Dict[int, FakeMember] = {
+            member_id: FakeMember(self, member_id) for member_id in range(1, member_count + 1)
+        }
+
+        # The first event starts soon enough to need both notifications, the rest are spread over the next weeks
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self._events: Dict[int, FakeScheduledEvent] = {}
+        for i, event_id in enumerate(range(10_000, 10_000 + event_count)):
+            offset = datetime.timedelta(minutes=30) if i == 0 else datetime.timedelta(days=2, hours=3 * i)
+            self._events[event_id] = FakeScheduledEvent(self, event_id, now + offset)
+
+    @property
+    def members(self) -> List[FakeMember]:
+        return list(self._members.values())
+
+    @property
+    def scheduled_events(self) -> List[FakeScheduledEvent]:
+        return list(self._events.values())
+
+    def get_member(self, member_id: int) -> Optional[FakeMember]:
+        return self._members.get(member_id)
+
+    async def query_members(self, user_ids: List[int], limit: int = 5, cache: bool = True) -> List[FakeMember]:
+        self.requests["query_members"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self._members[user_id] for user_id in user_ids[:limit] if user_id in self._members]
+
+    def get_scheduled_event(self, event_id: int) -> Optional[FakeScheduledEvent]:
+        return self._events.get(event_id)
+
+    async def fetch_scheduled_events(self) -> List[FakeScheduledEvent]:
+        self.requests["fetch_scheduled_events"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.scheduled_events
+
+
+class FakeInteraction:
+    """
+    Stands in for the discord.Interaction a slash command handler receives
+    """
+
+    class _Response:
+        async def defer(self, ephemeral: bool = False):
+            pass
+
+    class _Followup:
+        def __init__(self):
+            self.messages: List[str] = []
+
+        async def send(self, content: str):
+            self.messages.append(content)
+
+    def __init__(self, user: FakeMember):
+        self.user = user
+        self.guild_id = user.guild.id
+        self.response = self._Response()
+        self.followup = self._Followup()
@@ -0,0 +1,262 @@
+import asyncio
+import bisect
+import json
+import operator as operator_module
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from aiohttp import web
+
+
+def _parse_value(value: str) -> Any:
+    if value == "null":
+        return None
+    if value.lower() in ("true", "false"):
+        return value.lower() == "true"
+    for parse in (int, float):
+        try:
+            return parse(value)
+        except ValueError:
+            pass
+    return value
+
+
+def _matcher(column: str, expression: str) -> Callable[[Dict[str, Any]], bool]:
+    """
+    :return: Whether a row passes the filter, with the filter parsed once rather than once per row
+    """
+    operator, _, raw = expression.partition(".")
+    if operator == "in":
+        options = {str(_parse_value(v.strip('"'))) for v in raw.strip("()").split(",") if v}
+        return lambda row: str(row.get(column)) in options
+
+    expected = _parse_value(raw)
+    if operator == "is":
+        return lambda row: row.get(column) is expected
+    if operator == "eq":
+        return lambda row: str(row.get(column)) == str(expected)
+    if operator == "neq":
+        return lambda row: str(row.get(column)) != str(expected)
+    compare = {
+        "gt": operator_module.gt, "gte": operator_module.ge, "lt": operator_module.lt, "lte": operator_module.le
+    }.get(operator)
+    if compare is None:
+        raise ValueError(f"Unsupported operator {operator}")
+
+    def matches(row: Dict[str, Any]) -> bool:
+        actual = row.get(column)
+        if actual is None:
+            return False
+        # Text columns, like IDs, compare as text even when they hold digits
+        return compare(actual, raw if isinstance(actual, str) else expected)
+
+    return matches
+
+
+def toggle_user_setting(server: "FakePostgrest", params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Like the `toggle_user_setting` function the README asks for
+    """
+    users = server.tables.setdefault("users", {})
+    now = time.time()
+    row = users.get(params["user_key"])
+    if row is None:
+        row = users[params["user_key"]] = {
+            "id": params["user_key"], "guild_id": params["guild"], "created_at": int(now),
+            "is_ping_hour_before": False, "is_ping_day_before": False,
+        }
+        server._keys.pop("users", None)
+    row[params["setting"]] = not row[params["setting"]]
+    row["updated_at"] = now
+    return [row]
+
+
+class FakePostgrest:
+    """
+    A small in-process stand-in for Supabase's PostgREST API, good enough for the queries the bot makes.
+    Every request is counted and can be delayed to simulate network latency. Like Supabase, no more than
+    `max_rows` rows are returned at once
+    """
+
+    RESERVED_PARAMS = {"select", "order", "limit", "offset", "columns", "on_conflict"}
+
+    def __init__(self, latency: float = 0.0, host: str = "127.0.0.1", port: int = 0, max_rows: int = 1000):
+        self.latency = latency
+        self.max_rows = max_rows
+        self.host = host
+        self.port = port
+        self.tables: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # The database functions that can be called, by name
+        self.functions: Dict[str, Callable[["FakePostgrest", Dict[str, Any]], List[Dict[str, Any]]]] = {
+            "toggle_user_setting": toggle_user_setting,
+        }
+        # Each table's IDs in order, built when a read pages along them and dropped when rows come or go
+        self._keys: Dict[str, List[str]] = {}
+        # IDs whose inserts and upserts are rejected, like rows that break a constraint
+        self.rejected_ids: Set[str] = set()
+        self.requests: Counter = Counter()
+        self.peers: Set[Any] = set()
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def connections(self) -> int:
+        """
+        The number of distinct client connections seen, which shows whether clients reuse them
+        """
+        return len(self.peers)
+
+    @property
+    def request_count(self) -> int:
+        return sum(self.requests.values())
+
+    def seed(self, table: str, rows: List[Dict[str, Any]]):
+        target = self.tables.setdefault(table, {})
+        for row in rows:
+            target[str(row["id"])] = dict(row)
+        self._keys.pop(table, None)
+
+    def reset_counters(self):
+        self.requests.clear()
+        self.peers.clear()
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_route("POST", "/rest/v1/rpc/{function}", self._call)
+        app.router.add_route("*", "/rest/v1/{table}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> "FakePostgrest":
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    def _sorted_keys(self, table: str) -> List[str]:
+        keys = self._keys.get(table)
+        if keys is None:
+            keys = self._keys[table] = sorted(self.tables.setdefault(table, {}))
+        return keys
+
+    def _filter(self, table: str, request: web.Request) -> List[Dict[str, Any]]:
+        target = self.tables.setdefault(table, {})
+        id_filter = request.query.get("id", "")
+        matchers = [
+            _matcher(column, expression) for column, expression in request.query.items()
+            if column not in self.RESERVED_PARAMS
+        ]
+        if request.query.get("order") == "id" and "offset" not in request.query and not id_filter.startswith("eq."):
+            # Like paging along the primary key index, so a page costs the same however deep into the table it is
+            keys = self._sorted_keys(table)
+            start = bisect.bisect_right(keys, id_filter[3:]) if id_filter.startswith("gt.") else 0
+            limit = int(request.query.get("limit", len(keys)))
+            rows = []
+            for key in keys[start:]:
+                if len(rows) >= limit:
+                    break
+                if all(matches(target[key]) for matches in matchers):
+                    rows.append(target[key])
+            return rows
+
+        if id_filter.startswith("eq."):
+            # Like a primary key lookup, so the stand-in's own cost doesn't grow with the table
+            rows = [target[id_filter[3:]]] if id_filter[3:] in target else []
+        else:
+            rows = list(target.values())
+        for matches in matchers:
+            rows = [row for row in rows if matches(row)]
+
+        if "order" in request.query:
+            for clause in reversed(request.query["order"].split(",")):
+                column, _, direction = clause.partition(".")
+                rows.sort(key=lambda row: (row.get(column) is None, row.get(column)),
+                          reverse=direction.startswith("desc"))
+        offset = int(request.query.get("offset", 0))
+        rows = rows[offset:]
+        if "limit" in request.query:
+            rows = rows[:int(request.query["limit"])]
+        return rows
+
+    @staticmethod
+    def _project(rows: List[Dict[str, Any]], request: web.Request) -> List[Dict[str, Any]]:
+        select = request.query.get("select", "*")
+        if select == "*":
+            return rows
+        columns = select.split(",")
+        return [{column: row.get(column) for column in columns} for row in rows]
+
+    async def _call(self, request: web.Request) -> web.Response:
+        function = request.match_info["function"]
+        self.requests[("POST", f"rpc/{function}")] += 1
+        self.peers.add(request.transport.get_extra_info("peername"))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if function not in self.functions:
+            return web.json_response(
+                {"code": "PGRST202", "message": f"Could not find the function {function}", "details": None,
+                 "hint": None},
+                status=404
+            )
+        return web.json_response(self.functions[function](self, await request.json()), dumps=json.dumps)
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        table = request.match_info["table"]
+        self.requests[(request.method, table)] += 1
+        self.peers.add(request.transport.get_extra_info("peername"))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if request.method == "GET":
+            result = self._filter(table, request)[:self.max_rows]
+        elif request.method == "POST":
+            body = await request.json()
+            body = body if isinstance(body, list) else [body]
+            if any(str(row["id"]) in self.rejected_ids for row in body):
+                # Postgres rejects the whole statement
+                return web.json_response(
+                    {"code": "23514", "message": "new row violates check constraint", "details": None, "hint": None},
+                    status=400
+                )
+            target = self.tables.setdefault(table, {})
+            ignore = "resolution=ignore-duplicates" in request.headers.get("Prefer", "")
+            result = []
+            for row in body:
+                key = str(row["id"])
+                if key in target and ignore:
+                    continue
+                if key not in target:
+                    self._keys.pop(table, None)
+                target[key] = {**target.get(key, {}), **row}
+                result.append(target[key])
+        elif request.method == "PATCH":
+            body = await request.json()
+            result = []
+            for row in self._filter(table, request):
+                row.update(body)
+                result.append(row)
+        elif request.method == "DELETE":
+            result = self._filter(table, request)
+            target = self.tables.setdefault(table, {})
+            for row in result:
+                target.pop(str(row["id"]), None)
+            self._keys.pop(table, None)
+        else:
+            return web.Response(status=405)
+
+        if "return=minimal" in request.headers.get("Prefer", ""):
+            return web.Response(status=201 if request.method == "POST" else 204)
+        return web.json_response(self._project(result, request), dumps=json.dumps)
@@ -1,68 +1,166 @@
+import asyncio
 import time
-from typing import List, Literal
+from typing import Dict, List, Optional, Set
 
-import discord
 from discord import ScheduledEvent
 
 from discordbot.actions.timed_action import TimedAction
-from discordbot.models.event_models import Event
-from discordbot.models.user_models import User
+from discordbot.models.event_models import NOTIFIED_FLAGS, Event
+from discordbot.models.user_models import NotificationKind
 from discordbot.settings import SETTINGS
+from discordbot.store.supabase_manager import RowMissing
+from discordbot.util import notification_messages
 from main import DiscordClient
 
 
 class EventAction(TimedAction):
     """
     Although we try to listen for guild events, we can't listen for all of them.
-    This action will loop
+    This action will loop, as a safety net that re-syncs every event with the client's scheduled event
+    mirror, which only asks Discord now and then. Notifications themselves are sent on time by the client's
+    deadline scheduler, which calls `run_due`
     """
 
     def __init__(self, main: DiscordClient):
-        super().__init__(main, interval=60 * 5)  # 5 minutes
+        super().__init__(main, interval=60 * 30)  # 30 minutes
+        # Guilds are synced concurrently, but not all at once
+        self.guild_limit = asyncio.Semaphore(SETTINGS.guild_sync_concurrency)
 
     async def action(self):
-        guild = self.main.get_guild(SETTINGS.discord_guild_id)
-        if guild is None:
-            print("Guild not found... Could not update the events")
-            return
+        # This pass is our safety net against missed gateway events, so always start from fresh data. Only what
+        # changed since the last pass is downloaded
+        await self.main.subscribers.refresh()
 
-        # Update any events that have changed
-        scheduled_events = await guild.fetch_scheduled_events()
-        print(f"Found {scheduled_events} scheduled events")
-        supabase_events = await self.main.supabase_managers[Event].list()
+        supabase_events = await self.main.supabase_managers[Event].sync()
         print(f"Found {len(supabase_events)} supabase events")
+        guild_events: Dict[str, List[Event]] = {str(guild_id): [] for guild_id in SETTINGS.guild_ids}
+        for event in supabase_events:
+            if event.guild_id in guild_events:
+                guild_events[event.guild_id].append(event)
 
-        if not scheduled_events:
-            print("No scheduled events found")
-            return
+        results = await asyncio.gather(
+            *(self.sync_guild(int(guild_id), events) for guild_id, events in guild_events.items()),
+            return_exceptions=True
+        )
 
-        # Upload any missing events and updating any existing events
-        for event in scheduled_events:
-            supabase_event = next(
-                (e for e in supabase_events if e.id == str(event.id)),
-                None
-            )
-            if supabase_event is None:
-                supabase_event = Event.from_scheduled_event(event)
+        # Make sure the scheduler forgets events that are gone. A guild that failed to sync keeps its deadlines
+        known_ids = set()
+        failures = []
+        for (guild_id, events), result in zip(guild_events.items(), results):
+            if isinstance(result, BaseException):
+                print(f"Could not sync the events of guild {guild_id}: {result!r}")
+                failures.append(result)
+                known_ids.update(event.id for event in events)
             else:
+                known_ids.update(result)
+        for event_id in self.main.event_scheduler.keys() - known_ids:
+            self.main.event_scheduler.cancel(event_id)
+
+        if failures and len(failures) == len(results):
+            # Nothing synced, so let the timer retry soon
+            raise failures[0]
+
+    async def sync_guild(self, guild_id: int, supabase_events: List[Event]) -> Set[str]:
+        """
+        Syncs the events of one guild, and sends any notifications that are due
+        :param guild_id: The guild
+        :param supabase_events: The events we have stored for the guild
+        :return: The IDs of the guild's events that the scheduler now knows about
+        """
+        async with self.guild_limit:
+            guild = self.main.get_guild(guild_id)
+            if guild is None:
+                print(f"Guild {guild_id} not found... Could not update the events")
+                return {event.id for event in supabase_events}
+
+            # Update any events that have changed. The mirror only asks Discord when its copy is stale
+            scheduled_events = await self.main.scheduled_events.events(guild_id)
+            print(f"Found {len(scheduled_events)} scheduled events in guild {guild_id}")
+
+            if not scheduled_events:
+                print("No scheduled events found")
+                return {event.id for event in supabase_events}
+
+            # Index both sides by ID once, so matching them up is linear
+            supabase_index = {event.id: event for event in supabase_events}
+            scheduled_index = {str(event.id): event for event in scheduled_events}
+
+            # Upload any missing events and any existing events that actually changed
+            added_events, changed_events, unchanged_count = [], [], 0
+            for event_id, event in scheduled_index.items():
+                supabase_event = supabase_index.get(event_id)
+                if supabase_event is None:
+                    added_events.append(Event.from_scheduled_event(event))
+                    continue
+
                 supabase_event.update(event)
+                if supabase_event.dirty_fields:
+                    changed_events.append(supabase_event)
+                else:
+                    unchanged_count += 1
 
-            await self.main.supabase_managers[Event].upsert(supabase_event)
+            upserted = await self.main.supabase_managers[Event].upsert_many(added_events + changed_events)
+            supabase_index.update((event.id, event) for event in upserted)
+            print(f"Synced events in guild {guild_id}: {len(added_events)} added, {len(changed_events)} changed, "
+                  f"{unchanged_count} unchanged")
 
-        # Update our old events list... Redundant(?)
-        supabase_events = await self.main.supabase_managers[Event].list()
-        print(f"Checking again... Now have {len(supabase_events)} supabase events")
-        users = await self.main.supabase_managers[User].list()
+            await self.process_events(list(supabase_index.values()), scheduled_index)
 
-        # If we are within 24 hours of the event, notify the users
-        for event in supabase_events:
+            # Make sure the scheduler wakes up for every event Discord still has. The others can't be notified
+            # about or started, so waking up for them would do nothing
+            for event_id in scheduled_index:
+                self.main.event_scheduler.schedule(event_id, supabase_index[event_id].deadlines())
+            return set(scheduled_index.keys())
+
+    async def run_due(self, event_ids: Set[str]):
+        """
+        Called by the deadline scheduler when one of these events reached a notification or start deadline
+        :param event_ids: The IDs of the events that need attention
+        """
+        # Wait for a running sync to finish, so we don't process the same events twice
+        async with self.lock:
+            events = []
+            for event_id in event_ids:
+                # The gateway handlers may have a newer copy waiting to be written
+                event = self.main.event_writes.pending(event_id)
+                if event is None:
+                    event = await self.main.supabase_managers[Event].query(event_id)
+                if event is None:
+                    self.main.event_scheduler.cancel(event_id)
+                else:
+                    events.append(event)
+
+            scheduled_index = {
+                event.id: self.main.scheduled_events.get(int(event.guild_id), int(event.id)) for event in events
+            }
+            await self.process_events(events, scheduled_index)
+            for event in events:
+                if scheduled_index[event.id] is None:
+                    self.main.event_scheduler.cancel(event.id)
+                else:
+                    self.main.event_scheduler.schedule(event.id, event.deadlines())
+
+    async def process_events(
+            self,
+            events: List[Event],
+            scheduled_index: Dict[str, Optional[ScheduledEvent]]
+    ):
+        """
+        Sends any notifications that are due for the given events, and starts events that should have started
+        """
+        # Writes are fenced with the token we hold now, so if we lose the lease halfway, they are rejected
+        token = self.main.fencing_token
+        if self.main.leader is not None and token is None:
+            print("This replica is no longer the leader, leaving the events to the new one")
+            return
+
+        # Work out which notifications are due first, so the flags can be saved together
+        notifications = []
+        for event in events:
             start_time = event.start_time
             current_time = time.time()
 
-            scheduled_event: ScheduledEvent = next(
-                (e for e in scheduled_events if str(e.id) == event.id),
-                None
-            )
+            scheduled_event: Optional[ScheduledEvent] = scheduled_index.get(event.id)
 
             if not scheduled_event:
                 print(f"Could not find scheduled event with ID {event.id}... "
@@ -72,40 +170,90 @@ class EventAction(TimedAction):
             # If we are within 24 hours of the event, notify the users
             if not event.already_notified_24_hours and start_time - current_time <= 24 * 60 * 60:
                 event.already_notified_24_hours = True
-                await self.main.supabase_managers[Event].upsert(event)
-                await self.notify_users(guild, users, event, "is_ping_day_before")
+                notifications.append((event, "is_ping_day_before"))
 
             # If we are within 1 hour of the event, notify the users
             if not event.already_notified_1_hours and start_time - current_time <= 60 * 60:
                 event.already_notified_1_hours = True
-                await self.main.supabase_managers[Event].upsert(event)
-                await self.notify_users(guild, users, event, "is_ping_hour_before")
+                notifications.append((event, "is_ping_hour_before"))
 
             # Make sure we start the event, for the traditional event notifications
-            if start_time < current_time and event.status == "scheduled":
-                await scheduled_event.start()
+            if start_time <= current_time and event.status == "scheduled":
+                try:
+                    await scheduled_event.start()
+                except Exception as e:
+                    # The other events' notifications still go out, and the next pass tries to start it again
+                    print(f"Could not start event '{event.name}', will retry: {e!r}")
+                    continue
+                # So the start deadline isn't put back, the gateway update saves the new status
+                event.status = "active"
 
-    async def notify_users(
-            self,
-            guild: discord.Guild,
-            users: List[User],
-            event: Event,
-            time_attribute: Literal["is_ping_hour_before", "is_ping_day_before"]
-    ):
+        # Queue the DMs durably before saving the flags, so a crash can't lose a wave. Queuing is idempotent,
+        # so if we crash before the flags are saved, the next pass won't send anything twice. The jobs are held
+        # until the flags are saved, since another replica may have taken over as the leader in the meantime
+        waves: Dict[str, List[NotificationKind]] = {}
+        for event, kind in notifications:
+            self.notify_users(await self.main.subscribers.subscribers(int(event.guild_id), kind), event, kind, token)
+            waves.setdefault(event.id, []).append(kind)
+
+        events_by_id = {event.id: event for event, _ in notifications}
+        await asyncio.gather(
+            *(self.save_notified(events_by_id[event_id], kinds, token) for event_id, kinds in waves.items())
+        )
+        self.main.outbox.kick()
+
+    async def save_notified(self, event: Event, kinds: List[NotificationKind], token: Optional[int]):
         """
-        Sends a message to the users if they have the given time attribute set to True
+        Saves that the given waves of an event were sent, and lets their held DMs go out. The flags are written
+        with the leader's fencing token, so if a newer leader already saved them, the DMs are discarded instead
+        :param event: The event, with its flags already set
+        :param kinds: The waves that were queued for it
+        :param token: The fencing token of our leader lease, or None if leader election is off
         """
-        content = (f"We have an [event]({event.discord_link}) coming up! Make sure to check it out!"
-                   f"\n-# You can disable these notifications by using `/notifications`")
+        if self.main.leader is not None and token is None:
+            # An unfenced write could overwrite what the new leader saved. The DMs stay held
+            print(f"Refusing to save the notification flags of event '{event.name}' without a fencing token")
+            return
 
-        print(f"Sending notification to {len(users)} users for event '{event.name}'")
-        for user in users:
-            if not getattr(user, time_attribute):
-                continue
+        values = {NOTIFIED_FLAGS[kind]: True for kind in kinds}
+        try:
+            if self.main.event_writes.pending(event.id) is not None:
+                # A new event may only exist in the write buffer, and its flags can't be saved without a row
+                await self.main.event_writes.flush()
+            saved = await self.main.supabase_managers[Event].patch_fenced(event.id, values, token)
+        except Exception as e:
+            if isinstance(e, RowMissing):
+                print(f"Event '{event.name}' isn't stored yet, will save its notification flags later")
+            else:
+                print(f"Could not save the notification flags of event '{event.name}', will retry: {e!r}")
+            # The DMs stay held. Unset the flags again, so the next sync sees the waves are still due
+            for flag in values:
+                setattr(event, flag, False)
+            return
 
-            member = guild.get_member(int(user.id))
-            if member is None:
-                print(f"User with ID {user.id} not found in guild")
-                continue
+        if saved is None:
+            print(f"Another leader already saved the notification flags of event '{event.name}', "
+                  f"discarding its notifications")
+            for kind in kinds:
+                self.main.outbox.discard(event.id, kind)
+            return
+
+        for kind in kinds:
+            self.main.outbox.release(event.id, kind)
+        # The gateway handlers may have a copy waiting to be written, which run_due would read the flags from
+        pending = self.main.event_writes.pending(event.id)
+        if pending is not None:
+            for flag, value in values.items():
+                setattr(pending, flag, value)
 
-            await member.send(content=content)
+    def notify_users(self, user_ids: Set[int], event: Event, kind: NotificationKind, token: Optional[int] = None):
+        """
+        Queues a message to each of the given subscribers in the outbox, held until the wave is saved
+        :param token: The fencing token the wave will be saved with
+        """
+        content = notification_messages.event_notification(event)
+        line = notification_messages.event_line(event)
+        queued = self.main.outbox.enqueue(
+            int(event.guild_id), event.id, kind, user_ids, content, line, held=True, token=token
+        )
+        print(f"Queued notification to {queued} users for event '{event.name}'")
@@ -0,0 +1,86 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+
+class DeadlineScheduler:
+    """
+    Keeps a min-heap of upcoming deadlines (unix timestamps) for a set of keys, and sleeps until the
+    soonest one instead of polling. Rescheduling a key replaces all of its previous deadlines. Each deadline is
+    only reached once: deadlines at or before the last time a key was handed to the callback are dropped, so a
+    key whose deadlines are put back unchanged doesn't fire again straight away
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, str, int]] = []
+        self._generations: Dict[str, int] = {}
+        self._generation_counter = itertools.count()
+        # When each key was last handed to the callback
+        self._reached: Dict[str, float] = {}
+        self._changed = asyncio.Event()
+
+    def keys(self) -> Set[str]:
+        return set(self._generations.keys())
+
+    def schedule(self, key: str, deadlines: Iterable[float]):
+        """
+        Replaces the deadlines for the given key
+        :param key: What the deadlines are for, passed back to the callback when one is reached
+        :param deadlines: The unix timestamps to wake up at
+        """
+        generation = next(self._generation_counter)
+        self._generations[key] = generation
+        reached = self._reached.get(key)
+        for deadline in deadlines:
+            if reached is None or deadline > reached:
+                heapq.heappush(self._heap, (deadline, key, generation))
+        self._changed.set()
+
+    def cancel(self, key: str):
+        """
+        Forgets every deadline for the given key
+        """
+        self._reached.pop(key, None)
+        if self._generations.pop(key, None) is not None:
+            self._changed.set()
+
+    def _is_stale(self, generation: int, key: str) -> bool:
+        return self._generations.get(key) != generation
+
+    def _next_deadline(self) -> Optional[float]:
+        while self._heap and self._is_stale(self._heap[0][2], self._heap[0][1]):
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def _pop_due(self) -> Set[str]:
+        due = set()
+        now = time.time()
+        while (deadline := self._next_deadline()) is not None and deadline <= now:
+            _, key, _ = heapq.heappop(self._heap)
+            due.add(key)
+            self._reached[key] = now
+        return due
+
+    async def run(self, callback: Callable[[Set[str]], Awaitable[None]]):
+        """
+        Calls `callback` with the keys whose deadlines have passed, sleeping in between
+        :param callback: Handles a set of due keys. It should reschedule any keys that still have deadlines left
+        """
+        while True:
+            self._changed.clear()
+            due = self._pop_due()
+            if due:
+                try:
+                    await callback(due)
+                except Exception as e:
+                    print(f"Error while handling deadlines for {due}: {e}")
+                continue
+
+            deadline = self._next_deadline()
+            timeout = None if deadline is None else max(0.0, deadline - time.time())
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,107 @@
+import asyncio
+import os
+import socket
+import time
+import uuid
+from typing import Awaitable, Callable, Optional
+
+from discordbot.models.lease_models import Lease
+from discordbot.settings import SETTINGS
+from discordbot.store.leases import LeaseBackend
+from discordbot.util.metrics import METRICS
+
+
+class LeaderElector:
+    """
+    Keeps trying to hold a lease, so that out of several replicas exactly one is the leader. The leader renews
+    its lease every third of its ttl, and standbys try to take it over just as often, so a leader that dies is
+    replaced within about one ttl, and one that shuts down cleanly is replaced within a third of one.
+
+    A leader only trusts its lease for two thirds of the ttl after it was last renewed, so it steps down before
+    anyone else can take over, even if it can't reach the backend to find out. `on_elected` and `on_deposed` are
+    awaited whenever that changes
+    """
+
+    def __init__(
+            self,
+            backend: LeaseBackend,
+            name: str = "leader",
+            holder: Optional[str] = None,
+            ttl: float = SETTINGS.leader_lease_ttl,
+            on_elected: Optional[Callable[[], Awaitable[None]]] = None,
+            on_deposed: Optional[Callable[[], Awaitable[None]]] = None
+    ):
+        self.backend = backend
+        self.name = name
+        self.holder = holder or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.ttl = ttl
+        self.renew_interval = ttl / 3
+        self.on_elected = on_elected
+        self.on_deposed = on_deposed
+        self._lease: Optional[Lease] = None
+        self._valid_until = 0.0
+
+    @property
+    def is_leader(self) -> bool:
+        return self._lease is not None and time.monotonic() < self._valid_until
+
+    @property
+    def token(self) -> Optional[int]:
+        """
+        The fencing token of the lease, to pass along with writes only the leader may make
+        """
+        return self._lease.token if self.is_leader else None
+
+    async def step(self):
+        """
+        Takes or renews the lease once
+        """
+        started = time.monotonic()
+        try:
+            # Give up before the lease could run out, so a hanging request can't keep a stale leader around
+            lease = await asyncio.wait_for(
+                self.backend.acquire(self.name, self.holder, self.ttl), self.renew_interval
+            )
+        except Exception as e:
+            print(f"Could not renew the {self.name} lease: {e!r}")
+            METRICS.inc("leader_lease_failures_total", lease=self.name)
+            if self._lease is not None and not self.is_leader:
+                await self._change(None)
+            return
+
+        if lease is not None:
+            self._valid_until = started + self.ttl - self.renew_interval
+        await self._change(lease)
+
+    async def _change(self, lease: Optional[Lease]):
+        was_leader = self._lease is not None
+        self._lease = lease
+        if lease is not None and not was_leader:
+            print(f"{self.holder} is now the {self.name} (token {lease.token})")
+            METRICS.inc("leader_elections_total", lease=self.name)
+            if self.on_elected is not None:
+                await self.on_elected()
+        elif lease is None and was_leader:
+            print(f"{self.holder} is no longer the {self.name}")
+            if self.on_deposed is not None:
+                await self.on_deposed()
+
+    async def run(self):
+        """
+        Takes or renews the lease every `renew_interval` seconds, forever
+        """
+        while True:
+            await self.step()
+            await asyncio.sleep(self.renew_interval)
+
+    async def release(self):
+        """
+        Gives the lease up, so a standby takes over without waiting for it to expire
+        """
+        lease, self._lease = self._lease, None
+        if lease is None:
+            return
+        try:
+            await self.backend.release(self.name, self.holder, lease.token)
+        except Exception as e:
+            print(f"Could not release the {self.name} lease, it will expire instead: {e!r}")
@@ -0,0 +1,72 @@
+import asyncio
+from typing import TYPE_CHECKING, Callable, Coroutine, Dict
+
+if TYPE_CHECKING:
+    from discordbot.actions.timed_action import TimedAction
+
+
+class Supervisor:
+    """
+    Owns the bot's long-running background loops, and guarantees there is exactly one task per name, even
+    if `on_ready` fires again after a reconnect. Loops that die unexpectedly are reported and restarted
+    """
+
+    def __init__(self, restart_delay: float = 5):
+        self.restart_delay = restart_delay
+        self._factories: Dict[str, Callable[[], Coroutine]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._stopped = False
+
+    def run(self, name: str, factory: Callable[[], Coroutine]):
+        """
+        Starts `factory()` as a background task, unless a task with this name is already running
+        :param name: A unique name for the loop
+        :param factory: Creates the coroutine to run
+        """
+        if name in self._tasks and not self._tasks[name].done():
+            return
+
+        self._factories[name] = factory
+        task = asyncio.create_task(factory(), name=name)
+        task.add_done_callback(self._on_done)
+        self._tasks[name] = task
+
+    def add(self, action: "TimedAction"):
+        """
+        Starts a timed action, unless an action with the same name is already running
+        """
+        self.run(action.name, action.start)
+
+    async def cancel(self, name: str):
+        """
+        Stops the loop with the given name, without restarting it, and waits for it to finish
+        """
+        self._factories.pop(name, None)
+        task = self._tasks.pop(name, None)
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    def _on_done(self, task: asyncio.Task):
+        if self._stopped or task.cancelled():
+            return
+
+        name = task.get_name()
+        print(f"Background loop {name} stopped unexpectedly ({task.exception()!r}), "
+              f"restarting in {self.restart_delay} seconds")
+        asyncio.get_running_loop().call_later(self.restart_delay, self._restart, name)
+
+    def _restart(self, name: str):
+        if not self._stopped and name in self._factories:
+            self.run(name, self._factories[name])
+
+    async def stop(self):
+        """
+        Cancels every loop and waits for them to finish
+        """
+        self._stopped = True
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
@@ -1,13 +1,26 @@
 import asyncio
+import math
+import random
+import time
 from abc import ABC, abstractmethod
 
+from discordbot.util.metrics import METRICS
 from main import DiscordClient
 
 
 class TimedAction(ABC):
+    # Seconds to wait after the first failure, doubling with every failure in a row
+    base_backoff: float = 5
+    max_backoff: float = 60 * 5
+
     def __init__(self, main: DiscordClient, interval: int):
         self.main = main
         self.interval = interval
+        self.lock = asyncio.Lock()
+
+    @property
+    def name(self) -> str:
+        return self.__class__.__name__
 
     @abstractmethod
     async def action(self):
@@ -16,14 +29,52 @@ class TimedAction(ABC):
         """
         pass
 
+    async def run_once(self):
+        """
+        Runs the action. If it is already running (for example, triggered from somewhere else), this waits for
+        that run to finish first, so two runs never overlap
+        """
+        async with self.lock:
+            with METRICS.timer("timed_action_seconds", action=self.name):
+                await self.action()
+
+    def backoff(self, failures: int) -> float:
+        """
+        :param failures: How many times in a row the action failed
+        :return: Seconds to wait before trying again, with jitter so retries don't line up
+        """
+        delay = min(self.max_backoff, self.base_backoff * 2 ** (failures - 1))
+        return delay * random.uniform(0.5, 1.5)
+
     async def start(self):
         """
-        Start the timed action
+        Start the timed action. Runs are scheduled against a monotonic clock, so the period doesn't drift by
+        however long the action took, and a failing run is retried with backoff instead of ending the loop
         """
-        print(f"Running {self.__class__.__name__}")
+        print(f"Running {self.name}")
+        next_run = time.monotonic()
+        failures = 0
         while True:
-            print(f"Updating {self.__class__.__name__}")
-            await self.action()
-            print(f"Done updating {self.__class__.__name__}! Sleeping for {self.interval} seconds")
-            await asyncio.sleep(self.interval)
+            await asyncio.sleep(max(0.0, next_run - time.monotonic()))
+
+            print(f"Updating {self.name}")
+            try:
+                await self.run_once()
+            except Exception as e:
+                failures += 1
+                delay = self.backoff(failures)
+                print(f"{self.name} failed ({failures} in a row), retrying in {delay:.0f} seconds: {e}")
+                METRICS.inc("timed_action_failures_total", action=self.name)
+                next_run = time.monotonic() + delay
+                continue
 
+            failures = 0
+            next_run += self.interval
+            now = time.monotonic()
+            if next_run <= now:
+                # Skip the ticks we missed, rather than running back to back to catch up
+                missed = math.floor((now - next_run) / self.interval) + 1
+                next_run += missed * self.interval
+                print(f"{self.name} overran its {self.interval}s interval, skipping {missed} run(s)")
+                METRICS.inc("timed_action_overruns_total", action=self.name)
+            print(f"Done updating {self.name}! Next update in {next_run - now:.0f} seconds")
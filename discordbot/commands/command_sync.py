@@ -0,0 +1,44 @@
+import hashlib
+import json
+import os
+from typing import List, Optional
+
+from discord import app_commands
+from discord.app_commands import CommandTree
+
+from discordbot.settings import SETTINGS
+
+
+def fingerprint(tree: CommandTree) -> str:
+    """
+    Computes a stable hash of the commands registered in the tree, from the same payload `sync()` uploads
+    :param tree: The command tree
+    :return: The hex digest
+    """
+    payload = sorted((command.to_dict(tree) for command in tree.get_commands()), key=lambda command: command["name"])
+    data = json.dumps({"application_id": tree.client.application_id, "commands": payload}, sort_keys=True)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+async def sync_if_changed(
+        tree: CommandTree,
+        path: str = SETTINGS.command_fingerprint_path,
+        force: bool = SETTINGS.force_command_sync
+) -> Optional[List[app_commands.AppCommand]]:
+    """
+    Syncs the command tree with Discord, unless it is identical to the last tree we synced
+    :param tree: The command tree
+    :param path: Where the fingerprint of the last synced tree is stored
+    :param force: Sync even if the tree did not change
+    :return: The synced commands, or None if syncing was skipped
+    """
+    current = fingerprint(tree)
+    if not force and os.path.exists(path):
+        with open(path) as file:
+            if file.read().strip() == current:
+                return None
+
+    synced = await tree.sync()
+    with open(path, "w") as file:
+        file.write(current)
+    return synced
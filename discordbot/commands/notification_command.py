@@ -3,25 +3,44 @@ from typing import Optional
 from discord import app_commands, Interaction
 from discord.app_commands import CommandTree, Group
 
-from discordbot.models.user_models import User
-from discordbot.store.supabase_manager import SupabaseManager
+from discordbot.models.user_models import NotificationKind, User
+from discordbot.store.subscriber_index import SubscriberIndex
+from discordbot.store.supabase_manager import SupabaseManager, SupabaseUnavailable
 
 
-async def get_or_create_user(user_id: str, manager: SupabaseManager[User]) -> User:
-    user = await manager.query(user_id)
-    if user is None:
-        user = User(
-            id=user_id,
-            is_ping_hour_before=False,
-            is_ping_day_before=False,
-        )
-    return user
+async def set_notification(
+        interaction: Interaction,
+        kind: NotificationKind,
+        on: Optional[app_commands.Choice[int]],
+        manager: SupabaseManager[User],
+        subscribers: SubscriberIndex
+) -> bool:
+    """
+    Turns a kind of notification on or off for the member that used the command, in one request. A toggle
+    negates the setting in the database, so it can't be undone by a stale copy or a click on another replica
+    :param on: The choice the member made, or None to toggle the current setting
+    :return: Whether the notification is now enabled
+    """
+    key = User.key(interaction.guild_id, interaction.user.id)
+    guild_id = str(interaction.guild_id)
+    if on is not None:
+        user = await manager.patch(key, {"guild_id": guild_id, kind: on.value == 1})
+    else:
+        try:
+            user = (await manager.call("toggle_user_setting", {"user_key": key, "guild": guild_id, "setting": kind}))[0]
+        except SupabaseUnavailable:
+            # Queued for later, so the best we can do is toggle what we know
+            enabled = not await subscribers.is_subscribed(interaction.guild_id, kind, interaction.user.id)
+            user = await manager.patch(key, {"guild_id": guild_id, kind: enabled})
+    subscribers.record(user)
+    return getattr(user, kind)
 
 
-def register(tree: CommandTree, manager: SupabaseManager[User]):
+def register(tree: CommandTree, manager: SupabaseManager[User], subscribers: SubscriberIndex):
     notifications = Group(
         name="notifications",
         description="Manage your notification settings",
+        guild_only=True,  # Settings are per server
     )
 
     @notifications.command(
@@ -40,16 +59,9 @@ def register(tree: CommandTree, manager: SupabaseManager[User]):
     async def hour_before(interaction: Interaction, on: Optional[app_commands.Choice[int]] = None):
         await interaction.response.defer(ephemeral=True)
 
-        discord_user_id = str(interaction.user.id)
-        user = await get_or_create_user(discord_user_id, manager)
+        enabled = await set_notification(interaction, "is_ping_hour_before", on, manager, subscribers)
 
-        if on is None:
-            user.is_ping_hour_before = not user.is_ping_hour_before
-        else:
-            user.is_ping_hour_before = on.value == 1
-        await manager.upsert(user)
-
-        msg = f"Hour before notifications **{'enabled' if user.is_ping_day_before else 'disabled'}**"
+        msg = f"Hour before notifications **{'enabled' if enabled else 'disabled'}**"
         await interaction.followup.send(content=msg)
 
     @notifications.command(
@@ -68,15 +80,9 @@ def register(tree: CommandTree, manager: SupabaseManager[User]):
     async def day_before(interaction: Interaction, on: Optional[app_commands.Choice[int]] = None):
         await interaction.response.defer(ephemeral=True)
 
-        discord_user_id = str(interaction.user.id)
-        user = await get_or_create_user(discord_user_id, manager)
-        if on is None:
-            user.is_ping_day_before = not user.is_ping_day_before
-        else:
-            user.is_ping_day_before = on.value == 1
-        await manager.upsert(user)
+        enabled = await set_notification(interaction, "is_ping_day_before", on, manager, subscribers)
 
-        msg = f"Day before notifications **{'enabled' if user.is_ping_day_before else 'disabled'}**"
+        msg = f"Day before notifications **{'enabled' if enabled else 'disabled'}**"
         await interaction.followup.send(content=msg)
 
     # Add the commands to the tree
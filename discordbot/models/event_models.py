@@ -1,12 +1,23 @@
-from typing import Annotated, Literal, Optional
+from typing import Annotated, Any, ClassVar, Dict, FrozenSet, List, Literal, Optional
 
 from discord import ScheduledEvent
-from pydantic import Field
+from pydantic import Field, PrivateAttr
 
 from discordbot.models import supabase_models
+from discordbot.models.user_models import NotificationKind
+
+# The flag recording that each kind of notification was sent for an event
+NOTIFIED_FLAGS: Dict[NotificationKind, str] = {
+    "is_ping_day_before": "already_notified_24_hours",
+    "is_ping_hour_before": "already_notified_1_hours",
+}
 
 
 class Event(supabase_models.SupabaseModel):
+    guild_id: Annotated[str, Field(
+        ...,
+        description="The id of the guild the event belongs to"
+    )]
     name: Annotated[str, Field(
         ...,
         description="The name of the event"
@@ -55,23 +66,71 @@ class Event(supabase_models.SupabaseModel):
         False,
         description="Whether the users have already been notified 1 hour before the event"
     )]
+    fence: Annotated[int, Field(
+        0,
+        description="The fencing token of the leader that last saved the notification flags"
+    )]
+
+    # Only the leader saves the notification flags, so a replica's stale copy can't reset them
+    fenced_fields: ClassVar[FrozenSet[str]] = frozenset({
+        "already_notified_24_hours", "already_notified_1_hours", "fence"
+    })
+
+    # The fields changed by `update()` since this event was loaded. Kept immutable, since model copies share it
+    _dirty_fields: FrozenSet[str] = PrivateAttr(default=frozenset())
+
+    @property
+    def dirty_fields(self) -> FrozenSet[str]:
+        """
+        The fields that were changed by `update()` and have not been saved yet
+        """
+        return self._dirty_fields
+
+    def _set_if_changed(self, field: str, value: Any):
+        if getattr(self, field) != value:
+            setattr(self, field, value)
+            self._dirty_fields = self._dirty_fields | {field}
+
+    def update(self, event: ScheduledEvent) -> FrozenSet[str]:
+        """
+        Copies the state of the discord event onto this one
+        :return: The fields that changed
+        """
+        before = self._dirty_fields
+        self._dirty_fields = frozenset()
+        self._set_if_changed("name", event.name)
+        self._set_if_changed("description", event.description)
+        self._set_if_changed("entity_type", event.entity_type.name)
+        self._set_if_changed("entity_id", event.entity_id)
+        self._set_if_changed("start_time", int(event.start_time.timestamp()))
+        self._set_if_changed("end_time", int(event.end_time.timestamp()) if event.end_time else None)
+        self._set_if_changed("status", event.status.name)
+        self._set_if_changed("user_count", event.user_count)
+        self._set_if_changed("location", event.location)
+        self._set_if_changed("discord_link", f"https://discord.com/events/{event.guild_id}/{event.id}")
+        changed = self._dirty_fields
+        self._dirty_fields = before | changed
+        return changed
 
-    def update(self, event: ScheduledEvent):
-        self.name = event.name
-        self.description = event.description
-        self.entity_type = event.entity_type.name
-        self.entity_id = event.entity_id
-        self.start_time = int(event.start_time.timestamp())
-        self.end_time = int(event.end_time.timestamp()) if event.end_time else None
-        self.status = event.status.name
-        self.user_count = event.user_count
-        self.location = event.location
-        self.discord_link = f"https://discord.com/events/{event.guild_id}/{event.id}"
+    def deadlines(self) -> List[int]:
+        """
+        The unix timestamps at which this event still needs attention: the 24 hour and 1 hour notifications,
+        and starting the event
+        """
+        deadlines = []
+        if not self.already_notified_24_hours:
+            deadlines.append(self.start_time - 24 * 60 * 60)
+        if not self.already_notified_1_hours:
+            deadlines.append(self.start_time - 60 * 60)
+        if self.status == "scheduled":
+            deadlines.append(self.start_time)
+        return deadlines
 
     @staticmethod
     def from_scheduled_event(event: ScheduledEvent) -> "Event":
         return Event(
             id=str(event.id),
+            guild_id=str(event.guild_id),
             name=event.name,
             description=event.description,
             entity_type=event.entity_type.name,
@@ -0,0 +1,24 @@
+from typing import Annotated
+
+from pydantic import Field
+
+from discordbot.models import supabase_models
+
+
+class Lease(supabase_models.SupabaseModel):
+    """
+    A time limited claim on a role, like being the leader. The ID is the name of the role
+    """
+
+    holder: Annotated[str, Field(
+        ...,
+        description="Who holds the lease"
+    )]
+    token: Annotated[int, Field(
+        ...,
+        description="The fencing token, which goes up every time the lease changes hands"
+    )]
+    expires_at: Annotated[float, Field(
+        ...,
+        description="The unix timestamp the lease runs out at, unless it is renewed"
+    )]
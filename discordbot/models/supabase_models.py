@@ -1,9 +1,10 @@
 import time
 import uuid
 from abc import ABC
-from typing import Annotated
+from typing import Annotated, Any, ClassVar, Dict, FrozenSet, Set, Tuple
 
 from pydantic import BaseModel, Field
+from typing_extensions import Self
 
 
 def get_current_timestamp():
@@ -14,16 +15,55 @@ def get_current_timestamp():
     return int(time.time())
 
 
+# The field names, and the shared "fields set", of each model class hydrated with `SupabaseModel.from_row`
+_ROW_LAYOUTS: Dict[type, Tuple[Tuple[str, ...], Set[str]]] = {}
+
+
 class SupabaseModel(ABC, BaseModel):
     """
     A base model for all models we store in Supabase. All the data we upload has this same structure
     """
 
+    # Fields that are only written by fenced updates (see `SupabaseManager.patch_fenced`), never by upserts
+    fenced_fields: ClassVar[FrozenSet[str]] = frozenset()
+
     id: Annotated[str, Field(
-        default_factory=lambda: uuid.uuid4(),
+        default_factory=lambda: str(uuid.uuid4()),
         description="The unique identifier for this item of data"
     )]
     created_at: Annotated[int, Field(
         default_factory=get_current_timestamp,
         description="The unix timestamp of when this item of data was created, used internally for sorting"
     )]
+    updated_at: Annotated[float, Field(
+        default_factory=time.time,
+        description="The unix timestamp of the last time this item of data was written, used for incremental syncs"
+    )]
+
+    @classmethod
+    def from_row(cls, data: Dict[str, Any]) -> Self:
+        """
+        Builds the model from a row of one of our own tables, without validating it. That data was validated when
+        it was written, so this just fills in the fields. Every model of a class shares one "fields set", which is
+        safe because it already holds every field, and keeps each row about 40% smaller
+        :param data: The row, as returned by supabase
+        :return: The model
+        """
+        if cls not in _ROW_LAYOUTS:
+            _ROW_LAYOUTS[cls] = (tuple(cls.model_fields), set(cls.model_fields))
+        names, fields_set = _ROW_LAYOUTS[cls]
+
+        values = {name: data[name] for name in names if name in data}
+        if len(values) != len(names):
+            for name in names:
+                if name not in values:
+                    values[name] = cls.model_fields[name].get_default(call_default_factory=True)
+
+        obj = cls.__new__(cls)
+        object.__setattr__(obj, "__dict__", values)
+        object.__setattr__(obj, "__pydantic_fields_set__", fields_set)
+        object.__setattr__(obj, "__pydantic_extra__", None)
+        object.__setattr__(obj, "__pydantic_private__", {
+            name: attribute.get_default() for name, attribute in cls.__private_attributes__.items()
+        } or None)
+        return obj
@@ -1,16 +1,42 @@
-from typing import Annotated
+from typing import Annotated, Literal, Tuple
 
 from pydantic import Field
 
 from discordbot.models import supabase_models
 
+# The User fields that control each kind of event notification
+NotificationKind = Literal["is_ping_hour_before", "is_ping_day_before"]
+
 
 class User(supabase_models.SupabaseModel):
-    is_ping_hour_before: Annotated[bool, Field(
+    """
+    A member's settings in one guild. The ID is "<guild id>:<discord user id>", see `User.key`
+    """
+
+    guild_id: Annotated[str, Field(
         ...,
+        description="The id of the guild these settings are for"
+    )]
+    is_ping_hour_before: Annotated[bool, Field(
+        False,
         description="Whether to ping the user 1 hour before the event"
     )]
     is_ping_day_before: Annotated[bool, Field(
-        ...,
+        False,
         description="Whether to ping the user 1 hour before the event"
     )]
+
+    @staticmethod
+    def key(guild_id: int, user_id: int) -> str:
+        """
+        :return: The ID of a member's settings in a guild
+        """
+        return f"{guild_id}:{user_id}"
+
+    @staticmethod
+    def split_key(key: str) -> Tuple[int, int]:
+        """
+        :return: The guild ID and discord user ID in a settings ID
+        """
+        guild_id, user_id = key.split(":")
+        return int(guild_id), int(user_id)
@@ -1,3 +1,5 @@
+from typing import List, Optional
+
 from pydantic_settings import BaseSettings
 
 
@@ -5,11 +7,55 @@ class Settings(BaseSettings):
     # Discord bot token
     discord_token: str
     discord_guild_id: int
+    discord_guild_ids: List[int] = []  # Every guild to serve, as a JSON list. Defaults to just discord_guild_id
+    shard_count: Optional[int] = None  # Gateway shards to run, None lets Discord recommend how many
+    guild_sync_concurrency: int = 4  # Guilds whose events are synced at the same time
+    scheduled_event_reconcile_interval: float = 60 * 60 * 6  # Seconds between REST fetches of scheduled events
+    leader_election: bool = False  # Run several replicas, only the one holding the leader lease sends notifications
+    leader_lease_ttl: float = 15  # Seconds the leader lease lasts unless renewed, so roughly the failover time
+
+    command_fingerprint_path: str = ".command_tree.sha256"  # Hash of the last synced slash commands
+    force_command_sync: bool = False  # Sync slash commands on startup even if they did not change
+
+    lean_member_cache: bool = False  # Don't cache every guild member, request notification recipients on demand
+    member_cache_size: int = 1000  # How many requested members lean mode keeps around
 
     # Storing embeddings and events
     pinecone_api_key: str
     supabase_api_url: str
     supabase_api_key: str
+    supabase_pool_size: int = 10  # Max HTTP connections shared by every table manager
+    supabase_chunk_size: int = 500  # Max rows sent in one bulk request
+    supabase_page_size: int = 1000  # Max rows read in one request, Supabase caps responses at 1000 by default
+    supabase_sync_overlap: float = 5  # Seconds incremental syncs re-read, in case writers' clocks are behind
+    supabase_tombstone_retention: float = 60 * 60 * 24 * 7  # Seconds deleted rows are remembered for syncs
+    event_debounce_window: float = 5  # Seconds to collapse scheduled event gateway updates for
+    supabase_write_window: float = 2  # Seconds buffered writes wait to be coalesced before flushing
+    supabase_trusted_reads: bool = True  # Skip validating rows read back from our own tables
+    supabase_cache_ttl: float = 60 * 10  # Seconds a cached table is trusted for, 0 disables the cache
+    snapshot_path: Optional[str] = "supabase_snapshot.sqlite3"  # Local copy of each table, empty disables it
+    supabase_timeout: float = 10  # Seconds before a request counts as failed and reads use the local copy
+    supabase_offline_retry: float = 30  # Seconds to stay on the local copy after a failed request
+
+    # Sending DMs
+    dm_workers: int = 8  # DMs being sent at the same time
+    dm_rate_per_second: float = 5  # Average DMs per second, to stay under Discord's rate limits
+    dm_burst: float = 5  # DMs that can be sent back to back before the rate applies
+    welcome_window: float = 10  # Seconds to gather new members before welcoming them together
+    notification_digest_window: float = 5  # Seconds a wave waits for others to merge with, it delays every DM
+    outbox_path: str = "notification_outbox.sqlite3"  # Where queued notification DMs are stored
+    outbox_retry_delay: float = 60  # Seconds before DMs that failed to go out are tried again
+
+    # Metrics, off unless one of these is set
+    metrics_port: Optional[int] = None  # Serves Prometheus text on http://127.0.0.1:<port>/metrics
+    metrics_log_interval: Optional[float] = None  # Seconds between structured metrics log lines
+
+    @property
+    def guild_ids(self) -> List[int]:
+        """
+        The guilds the bot serves
+        """
+        return self.discord_guild_ids or [self.discord_guild_id]
 
     class Config:
         """
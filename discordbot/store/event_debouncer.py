@@ -0,0 +1,121 @@
+from typing import Dict
+
+import discord
+
+from discordbot.actions.event_scheduler import DeadlineScheduler
+from discordbot.models.event_models import Event
+from discordbot.settings import SETTINGS
+from discordbot.store.write_buffer import WriteBuffer
+from discordbot.util.flush_timer import FlushTimer
+from discordbot.util.metrics import METRICS
+
+# Changing these moves the event's deadlines, anything else only needs saving
+SCHEDULE_FIELDS = frozenset({"start_time", "status"})
+
+
+class EventDebouncer:
+    """
+    Sits between the scheduled event gateway handlers and the event write buffer. Only the latest state of
+    each discord event within `window` seconds is kept, and it is only written if one of the fields we store
+    actually changed, so a burst of RSVPs turns into at most one write
+    """
+
+    def __init__(
+            self,
+            writes: WriteBuffer[Event],
+            scheduler: DeadlineScheduler,
+            window: float = SETTINGS.event_debounce_window
+    ):
+        self.writes = writes
+        self.scheduler = scheduler
+        self.window = window
+        self._latest: Dict[str, discord.ScheduledEvent] = {}
+        # Bumped on every create, update and remove, so a flush can tell that its state went stale mid-await
+        self._versions: Dict[str, int] = {}
+        # The handlers only queue the state, the flushes are where their work is done
+        self._timer = FlushTimer(self.flush, window, "scheduled event updates", handler="event_updates_flush")
+
+    def _bump(self, event_id: str) -> int:
+        version = self._versions.get(event_id, 0) + 1
+        self._versions[event_id] = version
+        return version
+
+    def update(self, scheduled_event: discord.ScheduledEvent):
+        """
+        Queues the new state of a created or updated discord event, replacing any state still waiting
+        """
+        event_id = str(scheduled_event.id)
+        if event_id in self._latest:
+            METRICS.inc("gateway_event_updates_total", result="collapsed")
+        self._latest[event_id] = scheduled_event
+        self._bump(event_id)
+        self._timer.schedule()
+
+    def remove(self, scheduled_event: discord.ScheduledEvent):
+        """
+        Removes a deleted discord event right away, dropping any state still waiting for it
+        """
+        event_id = str(scheduled_event.id)
+        self._latest.pop(event_id, None)
+        if event_id in self._versions:
+            self._bump(event_id)
+        self.writes.remove(event_id)
+        self.scheduler.cancel(event_id)
+
+    async def flush(self):
+        """
+        Applies the latest state of every waiting discord event to our copy, and queues a write for the ones
+        that changed
+        """
+        latest, self._latest = self._latest, {}
+        versions = {event_id: self._versions[event_id] for event_id in latest}
+        try:
+            if sum(self.writes.pending(event_id) is None for event_id in latest) > 1:
+                # Loading the whole table once is cheaper than one query per event, and fills the cache
+                await self.writes.manager.list()
+            while latest:
+                event_id, scheduled_event = next(iter(latest.items()))
+                await self._apply(event_id, scheduled_event, versions[event_id])
+                del latest[event_id]
+        except Exception:
+            # Retry later, unless newer state came in while we were flushing
+            for event_id, scheduled_event in latest.items():
+                if self._versions.get(event_id) == versions[event_id]:
+                    self._latest[event_id] = scheduled_event
+            self._timer.schedule()
+            raise
+        finally:
+            for event_id, version in versions.items():
+                if self._versions.get(event_id) == version and event_id not in self._latest:
+                    del self._versions[event_id]
+
+    async def _apply(self, event_id: str, scheduled_event: discord.ScheduledEvent, version: int):
+        previous = self.writes.pending(event_id)
+        if previous is None:
+            previous = await self.writes.manager.query(event_id)
+            if self._versions.get(event_id) != version:
+                # Removed, or updated again, while we were loading it. That newer state wins
+                METRICS.inc("gateway_event_updates_total", result="superseded")
+                return
+
+        if previous is None:
+            event = Event.from_scheduled_event(scheduled_event)
+            self.writes.upsert(event)
+            self.scheduler.schedule(event.id, event.deadlines())
+            METRICS.inc("gateway_event_updates_total", result="created")
+            return
+
+        changed = previous.update(scheduled_event)
+        if not changed:
+            METRICS.inc("gateway_event_updates_total", result="unchanged")
+            return
+        self.writes.upsert(previous)
+        if changed & SCHEDULE_FIELDS:
+            self.scheduler.schedule(previous.id, previous.deadlines())
+        METRICS.inc("gateway_event_updates_total", result="updated")
+
+    async def close(self):
+        """
+        Applies anything still waiting and stops the timer
+        """
+        await self._timer.close()
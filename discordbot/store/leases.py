@@ -0,0 +1,91 @@
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Optional
+
+from discordbot.models.lease_models import Lease
+from discordbot.store.supabase_manager import SupabaseManager
+
+
+class LeaseBackend(ABC):
+    """
+    Where leases are stored. A lease is held by one holder at a time until it expires. Renewing a lease keeps
+    its fencing token, and taking over a lease from someone else always gives it a higher one
+    """
+
+    @abstractmethod
+    async def acquire(self, name: str, holder: str, ttl: float) -> Optional[Lease]:
+        """
+        Takes the lease if it is free or expired, or renews it if the holder already has it
+        :param name: The role the lease is for
+        :param holder: Who wants the lease
+        :param ttl: Seconds the lease lasts for, unless it is renewed
+        :return: The lease, or None if someone else holds it
+        """
+        pass
+
+    @abstractmethod
+    async def release(self, name: str, holder: str, token: int):
+        """
+        Gives the lease up early, so someone else can take it over right away. Does nothing if the lease
+        changed hands in the meantime
+        """
+        pass
+
+
+class MemoryLeaseBackend(LeaseBackend):
+    """
+    Keeps leases in memory. Only useful when every contender runs in the same process, like in tests
+    """
+
+    def __init__(self):
+        self.leases: Dict[str, Lease] = {}
+
+    async def acquire(self, name: str, holder: str, ttl: float) -> Optional[Lease]:
+        now = time.time()
+        current = self.leases.get(name)
+        if current is None:
+            token = 1
+        elif current.holder == holder:
+            token = current.token
+        elif current.expires_at <= now:
+            token = current.token + 1
+        else:
+            return None
+
+        lease = Lease(id=name, holder=holder, token=token, expires_at=now + ttl)
+        self.leases[name] = lease
+        return lease
+
+    async def release(self, name: str, holder: str, token: int):
+        current = self.leases.get(name)
+        if current is not None and current.holder == holder and current.token == token:
+            self.leases[name] = current.model_copy(update={"expires_at": 0})
+
+
+class SupabaseLeaseBackend(LeaseBackend):
+    """
+    Keeps each lease in a row of a supabase table. Every change is a conditional update on the holder and
+    token the row had when it was read, so two contenders can't both win. Expiry is checked against each
+    contender's own clock, so the replicas' clocks should agree to within a fraction of the lease's ttl
+    """
+
+    def __init__(self, manager: SupabaseManager[Lease]):
+        # Leases must be read from supabase every time, so the manager shouldn't cache or snapshot them
+        self.manager = manager
+
+    async def acquire(self, name: str, holder: str, ttl: float) -> Optional[Lease]:
+        now = time.time()
+        current = await self.manager.query(name)
+        if current is None:
+            return await self.manager.insert(Lease(id=name, holder=holder, token=1, expires_at=now + ttl))
+
+        if current.holder == holder:
+            values = {"expires_at": now + ttl}
+        elif current.expires_at <= now:
+            values = {"holder": holder, "token": current.token + 1, "expires_at": now + ttl}
+        else:
+            return None
+        return await self.manager.compare_and_set(name, {"holder": current.holder, "token": current.token}, values)
+
+    async def release(self, name: str, holder: str, token: int):
+        await self.manager.compare_and_set(name, {"holder": holder, "token": token}, {"expires_at": 0})
@@ -0,0 +1,277 @@
+import asyncio
+import sqlite3
+import time
+from typing import Awaitable, Callable, Collection, Dict, Iterable, List, Optional, Tuple
+
+from discord.abc import Messageable
+
+from discordbot.models.user_models import NotificationKind
+from discordbot.settings import SETTINGS
+from discordbot.util.dm_fanout import DMFanOut
+
+
+class NotificationOutbox:
+    """
+    A durable queue of notification DMs, stored in a local SQLite file. Each (event, user, kind) job is only
+    ever enqueued once, and jobs are checkpointed as they are delivered, so after a crash or restart the
+    wave resumes where it left off. Delivery is at-least-once: a crash mid-batch resends that batch.
+
+    Jobs are sent per user: everything pending for a user goes out as one DM, rendered with `digest` when it is
+    about more than one event. Draining waits `digest_window` seconds after a kick, so notifications queued
+    close together are merged too. If a guild's batch fails, its jobs stay pending and the drain moves on to the
+    other guilds, then tries again after `retry_delay` seconds.
+
+    Jobs can also be enqueued held, which keeps them from being sent until they are released. The leader holds
+    a wave's jobs until it has saved that the wave was sent, and discards them if another leader saved it first.
+    Jobs a crash left held are settled by `recover`, which checks whether the wave was saved before sending it
+    """
+
+    def __init__(
+            self,
+            sender: DMFanOut,
+            resolve: Callable[[int, List[int]], Awaitable[Dict[int, Messageable]]],
+            digest: Callable[[List[str]], str],
+            path: str = SETTINGS.outbox_path,
+            digest_window: float = SETTINGS.notification_digest_window,
+            retry_delay: float = SETTINGS.outbox_retry_delay,
+            batch_size: int = 100,
+            max_age: float = 60 * 60 * 24 * 30  # 30 days
+    ):
+        self.sender = sender
+        self.resolve = resolve
+        self.digest = digest
+        self.digest_window = digest_window
+        self.retry_delay = retry_delay
+        self.batch_size = batch_size
+        self._drain_task: Optional[asyncio.Task] = None
+
+        self._db = sqlite3.connect(path)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                guild_id INTEGER NOT NULL,
+                event_id TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                content TEXT NOT NULL,
+                line TEXT,
+                token INTEGER,
+                status TEXT NOT NULL DEFAULT 'pending',
+                created_at REAL NOT NULL,
+                PRIMARY KEY (event_id, user_id, kind)
+            )
+        """)
+        columns = {column for _, column, *_ in self._db.execute("PRAGMA table_info(jobs)")}
+        if "guild_id" not in columns:
+            # Outboxes from before the bot served several guilds only hold jobs for the original one
+            self._db.execute(
+                f"ALTER TABLE jobs ADD COLUMN guild_id INTEGER NOT NULL DEFAULT {int(SETTINGS.discord_guild_id)}"
+            )
+        if "line" not in columns:
+            # Jobs from before digests are sent as they are
+            self._db.execute("ALTER TABLE jobs ADD COLUMN line TEXT")
+        if "token" not in columns:
+            self._db.execute("ALTER TABLE jobs ADD COLUMN token INTEGER")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_recipients ON jobs (status, guild_id, user_id)")
+
+        # Finished jobs are only kept around to deduplicate
+        self._db.execute("DELETE FROM jobs WHERE status != 'pending' AND created_at < ?", (time.time() - max_age,))
+        self._db.commit()
+
+    def enqueue(
+            self,
+            guild_id: int,
+            event_id: str,
+            kind: NotificationKind,
+            user_ids: Iterable[int],
+            content: str,
+            line: str,
+            held: bool = False,
+            token: Optional[int] = None
+    ) -> int:
+        """
+        Adds a job for every user. Jobs that already exist, whether pending, held or done, are left alone
+        :param content: The DM to send when this is the user's only notification
+        :param line: How this notification is listed when it is merged with others
+        :param held: Whether the jobs wait for `release` before they are sent
+        :param token: The fencing token the wave will be saved with, so `recover` can tell whether we saved it
+        :return: The number of new jobs
+        """
+        now = time.time()
+        status = "held" if held else "pending"
+        cursor = self._db.executemany(
+            "INSERT OR IGNORE INTO jobs (guild_id, event_id, user_id, kind, content, line, token, status, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(guild_id, event_id, user_id, kind, content, line, token, status, now) for user_id in user_ids],
+        )
+        self._db.commit()
+        return cursor.rowcount
+
+    def release(self, event_id: str, kind: NotificationKind) -> int:
+        """
+        Lets the held jobs of a wave be sent
+        :return: The number of jobs released
+        """
+        cursor = self._db.execute(
+            "UPDATE jobs SET status = 'pending' WHERE status = 'held' AND event_id = ? AND kind = ?",
+            (event_id, kind),
+        )
+        self._db.commit()
+        return cursor.rowcount
+
+    def discard(self, event_id: str, kind: NotificationKind) -> int:
+        """
+        Forgets the held jobs of a wave, so they are never sent
+        :return: The number of jobs discarded
+        """
+        cursor = self._db.execute(
+            "DELETE FROM jobs WHERE status = 'held' AND event_id = ? AND kind = ?",
+            (event_id, kind),
+        )
+        self._db.commit()
+        return cursor.rowcount
+
+    def held_waves(self) -> List[Tuple[str, NotificationKind, Optional[int]]]:
+        """
+        :return: The (event, kind, token) of every wave with held jobs
+        """
+        return self._db.execute("SELECT DISTINCT event_id, kind, token FROM jobs WHERE status = 'held'").fetchall()
+
+    async def recover(self, saved: Callable[[str, NotificationKind, Optional[int]], Awaitable[bool]]):
+        """
+        Settles the waves a crash left held, before anything could hold new ones. Sending them blindly could
+        notify users twice, since another leader may have saved and sent the wave since. A wave that can't be
+        checked stays held
+        :param saved: Whether the wave's flag was saved with its token, so this replica's sending it is the
+                      only way it goes out. Otherwise it is discarded, and the leader queues it again if it is due
+        """
+        for event_id, kind, token in self.held_waves():
+            try:
+                ours = await saved(event_id, kind, token)
+            except Exception as e:
+                print(f"Could not check the held {kind} notifications of event {event_id}: {e!r}")
+                continue
+            if ours:
+                print(f"Sending {self.release(event_id, kind)} held {kind} notifications of event {event_id}")
+            else:
+                print(f"Discarding {self.discard(event_id, kind)} held {kind} notifications of event {event_id}")
+
+    def pending_count(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'pending'").fetchone()[0]
+
+    def _next_batch(self, skipped_guilds: Collection[int] = ()) -> List[Tuple[int, str, int, str, str, Optional[str]]]:
+        """
+        :param skipped_guilds: Guilds whose jobs are left alone
+        :return: Every pending job of the next `batch_size` users
+        """
+        placeholders = ", ".join("?" * len(skipped_guilds))
+        return self._db.execute(
+            "SELECT guild_id, event_id, user_id, kind, content, line FROM jobs "
+            "WHERE status = 'pending' AND (guild_id, user_id) IN ("
+            "    SELECT DISTINCT guild_id, user_id FROM jobs "
+            f"    WHERE status = 'pending' AND guild_id NOT IN ({placeholders}) "
+            "    ORDER BY guild_id, user_id LIMIT ?"
+            ")",
+            (*skipped_guilds, self.batch_size),
+        ).fetchall()
+
+    def render(self, jobs: List[Tuple[str, str, str, Optional[str]]]) -> str:
+        """
+        :param jobs: The (event, kind, content, line) of every job pending for one user
+        :return: The one DM that covers all of them
+        """
+        contents = list(dict.fromkeys(content for _, _, content, _ in jobs))
+        if len(contents) == 1:
+            return contents[0]
+        lines = list(dict.fromkeys(line for _, _, _, line in jobs))
+        if None in lines:
+            return "\n\n".join(contents)
+        return self.digest(lines)
+
+    def _checkpoint(self, results: List[Tuple[str, str, int, str]]):
+        self._db.executemany(
+            "UPDATE jobs SET status = ? WHERE event_id = ? AND user_id = ? AND kind = ?",
+            results,
+        )
+        self._db.commit()
+
+    def kick(self):
+        """
+        Starts draining the outbox in the background after the digest window, unless that is already happening
+        """
+        if self._drain_task is None or self._drain_task.done():
+            self._drain_task = asyncio.create_task(self._drain_later(self.digest_window))
+
+    async def _drain_later(self, delay: float):
+        if delay:
+            await asyncio.sleep(delay)
+        try:
+            done = await self.drain()
+        except Exception as e:
+            print(f"Could not drain the notification outbox, will retry in {self.retry_delay}s: {e!r}")
+            done = False
+        if not done:
+            # Not a kick, which would see this task still running
+            self._drain_task = asyncio.create_task(self._drain_later(self.retry_delay))
+
+    async def drain(self) -> bool:
+        """
+        Sends every pending job, one batch of users at a time, checkpointing after each batch. A guild whose batch
+        fails keeps its jobs pending, and is left out for the rest of the drain
+        :return: Whether every pending job was settled
+        """
+        failed_guilds = set()
+        while batch := self._next_batch(failed_guilds):
+            jobs: Dict[Tuple[int, int], List[Tuple[str, str, str, Optional[str]]]] = {}
+            for guild_id, event_id, user_id, kind, content, line in batch:
+                jobs.setdefault((guild_id, user_id), []).append((event_id, kind, content, line))
+            guilds: Dict[int, List[int]] = {}
+            for guild_id, user_id in jobs:
+                guilds.setdefault(guild_id, []).append(user_id)
+
+            for guild_id, user_ids in guilds.items():
+                try:
+                    await self._send_batch(guild_id, user_ids, jobs)
+                except Exception as e:
+                    print(f"Could not send the notifications in guild {guild_id}, will retry: {e!r}")
+                    failed_guilds.add(guild_id)
+        return not failed_guilds
+
+    async def _send_batch(
+            self,
+            guild_id: int,
+            user_ids: List[int],
+            jobs: Dict[Tuple[int, int], List[Tuple[str, str, str, Optional[str]]]]
+    ):
+        """
+        Sends one guild's share of a batch. Whatever was settled is checkpointed even if it fails halfway
+        """
+        results = []
+        try:
+            found = await self.resolve(guild_id, user_ids)
+            for user_id in user_ids:
+                if user_id not in found:
+                    results.extend(
+                        ("skipped", event_id, user_id, kind) for event_id, kind, _, _ in jobs[(guild_id, user_id)]
+                    )
+            messages = {user_id: self.render(jobs[(guild_id, user_id)]) for user_id in found}
+
+            def on_result(recipient: Messageable, sent: bool):
+                status = "sent" if sent else "failed"
+                results.extend(
+                    (status, event_id, recipient.id, kind) for event_id, kind, _, _ in jobs[(guild_id, recipient.id)]
+                )
+
+            report = await self.sender.send(
+                list(found.values()), lambda recipient: messages[recipient.id], on_result=on_result
+            )
+        finally:
+            self._checkpoint(results)
+        report.skipped += len(user_ids) - len(found)
+        notifications = sum(len(jobs[(guild_id, user_id)]) for user_id in user_ids)
+        print(f"Sent {notifications} notifications in guild {guild_id}: {report}")
+
+    def close(self):
+        if self._drain_task is not None:
+            self._drain_task.cancel()
+        self._db.close()
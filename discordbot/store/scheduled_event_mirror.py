@@ -0,0 +1,117 @@
+import asyncio
+import copy
+import time
+from typing import Dict, Iterable, List, Optional
+
+import discord
+
+from discordbot.settings import SETTINGS
+from discordbot.util.metrics import METRICS
+
+
+class ScheduledEventMirror:
+    """
+    An id-indexed copy of the scheduled events of every guild we serve. Each guild is fetched from the REST API
+    once, then kept current by the gateway handlers, and only fetched again every `reconcile_interval` seconds,
+    or after a new gateway session, since gateway events may have been missed in between.
+
+    Gateway payloads don't carry the number of interested users, so an event keeps the count from the last
+    fetch, adjusted by the gateway's user add and remove events
+    """
+
+    def __init__(
+            self,
+            client: discord.Client,
+            reconcile_interval: float = SETTINGS.scheduled_event_reconcile_interval
+    ):
+        self.client = client
+        self.reconcile_interval = reconcile_interval
+        self._events: Dict[int, Dict[int, discord.ScheduledEvent]] = {}
+        self._reconciled_at: Dict[int, float] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+
+    def is_stale(self, guild_id: int) -> bool:
+        reconciled_at = self._reconciled_at.get(guild_id)
+        return reconciled_at is None or time.monotonic() - reconciled_at >= self.reconcile_interval
+
+    def mark_stale(self, guild_ids: Iterable[int]):
+        """
+        Makes the next read of these guilds fetch their events again, after gateway events may have been lost
+        """
+        for guild_id in guild_ids:
+            self._reconciled_at.pop(guild_id, None)
+
+    async def reconcile(self, guild_id: int) -> bool:
+        """
+        Replaces the guild's events with the ones the REST API returns
+        :return: Whether the guild was found
+        """
+        guild = self.client.get_guild(guild_id)
+        if guild is None:
+            return False
+
+        scheduled_events = await guild.fetch_scheduled_events()
+        self._events[guild_id] = {event.id: event for event in scheduled_events}
+        self._reconciled_at[guild_id] = time.monotonic()
+        METRICS.inc("scheduled_event_reconciles_total", guild=str(guild_id))
+        return True
+
+    async def seed(self, guild_ids: Iterable[int]):
+        """
+        Fetches every stale guild at once. A guild that fails stays stale, so its next read tries again
+        """
+        guild_ids = [guild_id for guild_id in guild_ids if self.is_stale(guild_id)]
+        results = await asyncio.gather(*(self.reconcile(guild_id) for guild_id in guild_ids), return_exceptions=True)
+        for guild_id, result in zip(guild_ids, results):
+            if isinstance(result, BaseException):
+                print(f"Could not fetch the scheduled events of guild {guild_id}: {result!r}")
+
+    async def events(self, guild_id: int) -> List[discord.ScheduledEvent]:
+        """
+        :return: Every scheduled event in the guild, only fetched from Discord if the copy is stale
+        """
+        lock = self._locks.setdefault(guild_id, asyncio.Lock())
+        async with lock:
+            if self.is_stale(guild_id):
+                await self.reconcile(guild_id)
+        return list(self._events.get(guild_id, {}).values())
+
+    def get(self, guild_id: int, event_id: int) -> Optional[discord.ScheduledEvent]:
+        """
+        Looks up one event, without ever making a request. While the guild is waiting to be fetched, events we
+        haven't seen yet are looked up in the ones discord.py got when it connected
+        """
+        scheduled_event = self._events.get(guild_id, {}).get(event_id)
+        if scheduled_event is not None or guild_id in self._reconciled_at:
+            return scheduled_event
+        guild = self.client.get_guild(guild_id)
+        return guild.get_scheduled_event(event_id) if guild is not None else None
+
+    def put(self, scheduled_event: discord.ScheduledEvent) -> discord.ScheduledEvent:
+        """
+        Records an event the gateway created or updated
+        :return: The event as mirrored, with the last known user count
+        """
+        # discord.py updates its own copy in place, which would reset the count we kept
+        scheduled_event = copy.copy(scheduled_event)
+        events = self._events.setdefault(scheduled_event.guild_id, {})
+        previous = events.get(scheduled_event.id)
+        if previous is not None and not scheduled_event.user_count:
+            scheduled_event.user_count = previous.user_count
+        events[scheduled_event.id] = scheduled_event
+        return scheduled_event
+
+    def remove(self, scheduled_event: discord.ScheduledEvent):
+        self._events.get(scheduled_event.guild_id, {}).pop(scheduled_event.id, None)
+
+    def add_users(self, scheduled_event: discord.ScheduledEvent, count: int) -> Optional[discord.ScheduledEvent]:
+        """
+        Adjusts the user count of an event, when a user says they are interested or not anymore
+        :param count: How many users were added, negative if they were removed
+        :return: The event as mirrored, or None if we don't know it
+        """
+        mirrored = self._events.get(scheduled_event.guild_id, {}).get(scheduled_event.id)
+        if mirrored is None:
+            return None
+        mirrored.user_count = max(0, mirrored.user_count + count)
+        return mirrored
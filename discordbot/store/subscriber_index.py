@@ -0,0 +1,152 @@
+import asyncio
+import time
+from typing import Dict, Iterable, Optional, Set, Tuple, get_args
+
+from discordbot.models.user_models import NotificationKind, User
+from discordbot.store.supabase_manager import SupabaseManager, SupabaseUnavailable
+
+
+class SubscriberIndex:
+    """
+    The IDs of the users that opted in to each kind of notification, per guild. It is filled from the users
+    table once, then kept current by the notification commands, and later refreshes only download the users
+    that changed since. Users only have a few small columns, so whole rows are read, which keeps the manager's
+    local snapshot current too, and the index can be filled from it when supabase is down at startup
+    """
+
+    def __init__(self, manager: SupabaseManager[User]):
+        self.manager = manager
+        self._subscribers: Optional[Dict[NotificationKind, Dict[int, Set[int]]]] = None
+        self._watermark: Optional[float] = None
+        self._lock = asyncio.Lock()
+        # Users saved since a refresh started, and when, so a refresh that read them before can't undo it
+        self._recorded: Dict[str, Tuple[float, User]] = {}
+
+    async def refresh(self):
+        """
+        Brings every kind of subscriber up to date with the database, reading just the users that changed
+        since the last refresh
+        """
+        async with self._lock:
+            started = time.time()
+            try:
+                await self._refresh(started)
+            finally:
+                self._recorded = {
+                    key: (recorded_at, user) for key, (recorded_at, user) in self._recorded.items()
+                    if recorded_at >= started
+                }
+
+    async def _refresh(self, started: float):
+        try:
+            if self._watermark is None:
+                await self._load()
+                self._watermark = started
+                return
+            delta = await self.manager.list_since(self._watermark)
+        except SupabaseUnavailable as e:
+            if self._subscribers is not None:
+                print(f"Could not refresh the subscribers, keeping the ones we have: {e}")
+                return
+            print(f"Could not load the subscribers, using the local copy: {e}")
+            # Listing falls back on the snapshot, which may be stale, so the next refresh loads them again
+            self._fill(user.model_dump() for user in await self.manager.list())
+            self._watermark = None
+            return
+
+        if delta.full:
+            self._fill(delta.rows)
+            # Rows are often written together, so picking up from the newest one would read them all again
+            self._watermark = started
+            return
+
+        self._apply(delta.rows)
+        for key in delta.removed:
+            guild_id, user_id = User.split_key(key)
+            for kind in get_args(NotificationKind):
+                self.set(guild_id, kind, user_id, False)
+        self._watermark = delta.watermark
+
+    async def _load(self):
+        """
+        Loads every kind of subscriber from the whole users table, one page at a time
+        """
+        subscribers = {kind: {} for kind in get_args(NotificationKind)}
+        read_later = set()
+        async for data in self.manager.copy():
+            fresher = self._fresher(data)
+            if fresher is data and data["id"] in self._recorded:
+                read_later.add(data["id"])
+            guild_id, user_id = User.split_key(data["id"])
+            for kind in subscribers:
+                if fresher.get(kind):
+                    subscribers[kind].setdefault(guild_id, set()).add(user_id)
+        self._subscribers = subscribers
+        # Users saved while the table was read may have been read before, unless their row was already newer
+        self._apply(user.model_dump() for key, (_, user) in self._recorded.items() if key not in read_later)
+
+    def _fill(self, rows: Iterable[dict]):
+        """
+        Replaces every kind of subscriber with the ones in the given users
+        """
+        self._subscribers = {kind: {} for kind in get_args(NotificationKind)}
+        self._apply(rows)
+
+    def _fresher(self, data: dict) -> dict:
+        """
+        :return: A user's row as it was read, or as we saved it if that was later
+        """
+        recorded = self._recorded.get(data["id"])
+        if recorded is not None and recorded[1].updated_at > (data.get("updated_at") or 0):
+            return recorded[1].model_dump()
+        return data
+
+    def _apply(self, rows: Iterable[dict]):
+        for data in rows:
+            data = self._fresher(data)
+            guild_id, user_id = User.split_key(data["id"])
+            for kind in get_args(NotificationKind):
+                self.set(guild_id, kind, user_id, bool(data.get(kind)))
+
+    async def subscribers(self, guild_id: int, kind: NotificationKind) -> Set[int]:
+        """
+        :param guild_id: The guild the notification is for
+        :param kind: The kind of notification
+        :return: The IDs of the users in that guild that want this kind of notification
+        """
+        if self._subscribers is None:
+            await self.refresh()
+        return set(self._subscribers[kind].get(guild_id, ()))
+
+    async def is_subscribed(self, guild_id: int, kind: NotificationKind, user_id: int) -> bool:
+        """
+        :return: Whether the user in the guild wants this kind of notification
+        """
+        if self._subscribers is None:
+            await self.refresh()
+        return user_id in self._subscribers[kind].get(guild_id, ())
+
+    def record(self, user: User):
+        """
+        Records a user's settings as they were just saved, unless a later save was recorded already
+        """
+        recorded = self._recorded.get(user.id)
+        if recorded is not None and recorded[1].updated_at > user.updated_at:
+            return
+        self._recorded[user.id] = (time.time(), user)
+        guild_id, user_id = User.split_key(user.id)
+        for kind in get_args(NotificationKind):
+            self.set(guild_id, kind, user_id, getattr(user, kind))
+
+    def set(self, guild_id: int, kind: NotificationKind, user_id: int, enabled: bool):
+        """
+        Records a user's new setting, after it has been saved
+        """
+        if self._subscribers is None:
+            # Nothing loaded yet, the next refresh will see the saved value
+            return
+
+        if enabled:
+            self._subscribers[kind].setdefault(guild_id, set()).add(user_id)
+        else:
+            self._subscribers[kind].get(guild_id, set()).discard(user_id)
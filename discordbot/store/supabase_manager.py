@@ -1,16 +1,71 @@
-from typing import TypeVar, Generic, Optional, Type, List
+import asyncio
+import functools
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, TypeVar, Generic, Optional, Type, List
 
-from supabase._async.client import AsyncClient, create_client
+import httpx
+from postgrest.exceptions import APIError
+from pydantic import BaseModel
+from supabase._async.client import AsyncClient
 
 from discordbot.models import supabase_models
 from discordbot.settings import SETTINGS
+from discordbot.store.supabase_pool import SupabaseClientPool, get_pool
+from discordbot.store.table_cache import TableCache
+from discordbot.store.table_snapshot import TableSnapshot
+from discordbot.util.metrics import METRICS
 
 T = TypeVar("T", bound=supabase_models.SupabaseModel)
+R = TypeVar("R")
+
+# Where every table records the IDs of its removed rows, so incremental syncs can see removals
+TOMBSTONES_TABLE = "tombstones"
+
+
+class SupabaseUnavailable(Exception):
+    """
+    Raised when supabase can't be reached, or doesn't answer in time
+    """
+
+
+class RowMissing(Exception):
+    """
+    Raised when a write that only updates finds no row to update
+    """
+
+
+class TableDelta(BaseModel):
+    """
+    What changed in a table since a watermark, see `SupabaseManager.list_since`
+    """
+
+    rows: List[Dict[str, Any]] = []  # The rows written since the watermark
+    removed: List[str] = []  # The IDs of the rows removed since the watermark
+    watermark: Optional[float] = None  # Where the next call should pick up from
+    full: bool = False  # Whether the watermark was missing or too old, so `rows` is the whole table
+
+
+def instrumented(func):
+    """
+    Records the latency and errors of a SupabaseManager method, per table
+    """
+
+    @functools.wraps(func)
+    async def wrapper(self: "SupabaseManager", *args, **kwargs):
+        with METRICS.timer("supabase_call_seconds", table=self.table_name, method=func.__name__):
+            return await func(self, *args, **kwargs)
+
+    return wrapper
 
 
 class SupabaseManager(Generic[T]):
     """
-    A manager for 1 supabase table
+    A manager for 1 supabase table. If `cache_ttl` is given, reads are served from a write-through
+    in-memory copy of the table for up to that many seconds. With `trusted_reads`, rows read back from the
+    table are hydrated without validation, since everything in it was validated when it was written.
+
+    If `snapshot_path` is given, the table is also copied to a local file. The cache starts warm from it, reads
+    fall back to it while supabase is unreachable, and writes made in the meantime are replayed when it is back
     """
 
     def __init__(
@@ -18,61 +73,609 @@ class SupabaseManager(Generic[T]):
             table_name: str,
             model: Type[T],
             api_url: str = SETTINGS.supabase_api_url,
-            api_key: str = SETTINGS.supabase_api_key
+            api_key: str = SETTINGS.supabase_api_key,
+            pool: Optional[SupabaseClientPool] = None,
+            cache_ttl: Optional[float] = None,
+            chunk_size: int = SETTINGS.supabase_chunk_size,
+            trusted_reads: bool = SETTINGS.supabase_trusted_reads,
+            snapshot_path: Optional[str] = None,
+            timeout: float = SETTINGS.supabase_timeout,
+            offline_retry: float = SETTINGS.supabase_offline_retry,
+            page_size: int = SETTINGS.supabase_page_size,
+            sync_overlap: float = SETTINGS.supabase_sync_overlap,
+            tombstone_retention: float = SETTINGS.supabase_tombstone_retention
     ):
         self.table_name = table_name
         self.model = model
         self.api_url = api_url
         self.api_key = api_key
+        self.pool = pool or get_pool(api_url, api_key)
+        self.cache: Optional[TableCache[T]] = TableCache(cache_ttl) if cache_ttl else None
+        self.chunk_size = chunk_size
+        self.trusted_reads = trusted_reads
+        self.snapshot: Optional[TableSnapshot] = TableSnapshot(snapshot_path, table_name) if snapshot_path else None
+        self.timeout = timeout
+        self.offline_retry = offline_retry
+        self._offline_until = 0.0
+        self.page_size = page_size
+        self.sync_overlap = sync_overlap
+        self.tombstone_retention = tombstone_retention
+        # The `updated_at` of the newest row in the cache, when the cache holds the whole table
+        self._watermark: Optional[float] = None
+
+        if self.snapshot is not None and self.cache is not None:
+            rows = self.snapshot.load()
+            if rows is not None:
+                self.cache.fill([self.hydrate(data) for data in rows])
+                # The first sync only needs what changed since the snapshot was taken
+                self._watermark = self._latest(rows)
 
     async def client(self) -> AsyncClient:
         """
-        Returns an async client for the Supabase API
+        Returns the pooled async client for the Supabase API
         :return: The async client
         """
-        return await create_client(
-            self.api_url,
-            self.api_key,
-        )
+        return await self.pool.client()
+
+    def dump(self, obj: T) -> dict:
+        """
+        The row to upsert for an object, stamped with the time it is written. Fenced fields are left out, they
+        are only written by `patch_fenced`
+        :param obj: The object
+        :return: The row
+        """
+        data = obj.model_dump(mode="json", exclude=set(self.model.fenced_fields) or None)
+        data["updated_at"] = time.time()
+        return data
+
+    def hydrate(self, data: dict) -> T:
+        """
+        Builds a model from a row returned by the database
+        :param data: The row
+        :return: The model
+        """
+        if self.trusted_reads:
+            return self.model.from_row(data)
+        return self.model(**data)
+
+    @property
+    def is_offline(self) -> bool:
+        """
+        Whether a recent request failed to reach supabase, so requests go to the snapshot for now
+        """
+        return time.monotonic() < self._offline_until
+
+    async def _remote(self, request: Callable[[AsyncClient], Awaitable[R]]) -> R:
+        """
+        Runs a request against supabase. Without a snapshot, this is all it does. With one, writes queued while
+        offline are replayed first, and a request that can't connect or times out raises SupabaseUnavailable
+        :param request: Builds and executes the request with the given client
+        :return: The result of the request
+        """
+        if self.snapshot is None:
+            return await request(await self.client())
+        if self.is_offline:
+            raise SupabaseUnavailable(f"{self.table_name} is offline")
+
+        try:
+            supabase = await self.client()
+            if self.snapshot.has_pending_writes():
+                await self._replay(supabase)
+            return await asyncio.wait_for(request(supabase), self.timeout)
+        except (asyncio.TimeoutError, httpx.TransportError, OSError) as e:
+            print(f"Supabase is unreachable, using the {self.table_name} snapshot for "
+                  f"{self.offline_retry:.0f} seconds: {e!r}")
+            METRICS.inc("supabase_offline_total", table=self.table_name)
+            self._offline_until = time.monotonic() + self.offline_retry
+            raise SupabaseUnavailable(f"{self.table_name} is unreachable") from e
+
+    async def _replay(self, supabase: AsyncClient):
+        """
+        Sends the writes that were queued while offline
+        """
+        last_seq, upserts, removals, patches = self.snapshot.pending_writes()
+
+        async def upsert(rows: List[dict]):
+            await asyncio.wait_for(supabase.table(self.table_name).upsert(rows).execute(), self.timeout)
+
+        async def patch(rows: List[dict]):
+            # Leave the columns a patch doesn't set alone, like `patch` does
+            request = supabase.table(self.table_name).upsert(rows, default_to_null=False)
+            await asyncio.wait_for(request.execute(), self.timeout)
+
+        async def remove(object_ids: List[str]):
+            request = supabase.table(self.table_name).delete().in_("id", object_ids)
+            await asyncio.wait_for(request.execute(), self.timeout)
+            await asyncio.wait_for(self._bury(supabase, object_ids), self.timeout)
+
+        rejected = 0
+        for i in range(0, len(upserts), self.chunk_size):
+            rejected += await self._replay_chunk(upserts[i:i + self.chunk_size], upsert)
+        for i in range(0, len(removals), self.chunk_size):
+            rejected += await self._replay_chunk(removals[i:i + self.chunk_size], remove)
+        # Rows in one bulk upsert must set the same columns
+        patches_by_columns: Dict[frozenset, List[dict]] = {}
+        for values in patches:
+            patches_by_columns.setdefault(frozenset(values), []).append(values)
+        for rows in patches_by_columns.values():
+            for i in range(0, len(rows), self.chunk_size):
+                rejected += await self._replay_chunk(rows[i:i + self.chunk_size], patch)
+        self.snapshot.ack(last_seq)
+        print(f"Replayed {len(upserts)} upserts, {len(removals)} removals and {len(patches)} patches to "
+              f"{self.table_name}, {rejected} rejected")
+
+    async def _replay_chunk(self, items: List[Any], write: Callable[[List[Any]], Awaitable[None]]) -> int:
+        """
+        Sends one chunk of queued writes. If supabase rejects it, its writes are sent one at a time, and the ones
+        it still rejects are logged and set aside, so a bad row can't hold up the queue forever. Failing to reach
+        supabase still raises, which keeps the queue for later
+        :param items: The rows to upsert or patch, or the IDs to remove
+        :param write: Sends some of the items
+        :return: The number of writes that were rejected
+        """
+        try:
+            await write(items)
+            return 0
+        except APIError as e:
+            if len(items) == 1:
+                self._reject(items[0], e)
+                return 1
+
+        rejected = 0
+        for item in items:
+            try:
+                await write([item])
+            except APIError as e:
+                self._reject(item, e)
+                rejected += 1
+        return rejected
+
+    def _reject(self, item: Any, error: APIError):
+        print(f"Supabase rejected a queued write to {self.table_name}, setting it aside: {item!r} ({error!r})")
+        METRICS.inc("supabase_rejected_writes_total", table=self.table_name)
+
+    async def _bury(self, supabase: AsyncClient, object_ids: List[str]):
+        """
+        Leaves a tombstone for every removed row, and clears out the table's tombstones that are too old to matter
+        """
+        now = time.time()
+        tombstones = [
+            {"id": f"{self.table_name}:{object_id}", "table_name": self.table_name, "object_id": object_id,
+             "updated_at": now}
+            for object_id in object_ids
+        ]
+        await supabase.table(TOMBSTONES_TABLE).upsert(tombstones).execute()
+        await (supabase.table(TOMBSTONES_TABLE).delete().eq("table_name", self.table_name)
+               .lt("updated_at", now - self.tombstone_retention).execute())
+
+    @staticmethod
+    def _latest(rows: List[dict], watermark: Optional[float] = None) -> Optional[float]:
+        """
+        :return: The newest `updated_at` out of the rows and the watermark, or None if there is none
+        """
+        stamps = [row["updated_at"] for row in rows if row.get("updated_at") is not None]
+        if watermark is not None:
+            stamps.append(watermark)
+        return max(stamps, default=None)
+
+    def _fallback(self, method: str) -> TableSnapshot:
+        """
+        :return: The snapshot to read from instead, if it holds a copy of the table
+        :raise SupabaseUnavailable: If there is nothing to fall back on
+        """
+        if self.snapshot.synced_at is None:
+            raise SupabaseUnavailable(f"{self.table_name} is unreachable and was never copied locally")
+        METRICS.inc("supabase_fallback_total", table=self.table_name, method=method)
+        return self.snapshot
+
+    def _saved(self, rows: List[dict]) -> List[T]:
+        """
+        Hydrates rows supabase returned after a write, keeping the cache and snapshot in step
+        """
+        objs = [self.hydrate(data) for data in rows]
+        if self.cache is not None:
+            for obj in objs:
+                self.cache.put(obj)
+        if self.snapshot is not None:
+            self.snapshot.put(rows)
+        return objs
+
+    def _queue_upserts(self, objs: List[T], upload_data: List[dict]):
+        self.snapshot.queue_upserts(upload_data)
+        if self.model.fenced_fields:
+            # The queued rows leave the fenced columns out, but the local copy should still have them
+            self.snapshot.put([obj.model_dump(mode="json") for obj in objs])
+        if self.cache is not None:
+            for obj in objs:
+                self.cache.put(obj)
+        METRICS.inc("supabase_queued_writes_total", value=len(objs), table=self.table_name)
+
+    def _queue_removals(self, object_ids: List[str]):
+        self.snapshot.queue_removals(object_ids)
+        if self.cache is not None:
+            for object_id in object_ids:
+                self.cache.discard(object_id)
+        METRICS.inc("supabase_queued_writes_total", value=len(object_ids), table=self.table_name)
 
+    @instrumented
     async def upsert(self, obj: T) -> T:
         """
         Upserts (overrides the existing data) the object in the database
         :param obj: The object to upsert
         :return: The object that was upserted (changes may have been made by supabase)
         """
-        supabase = await self.client()
-        upload_data = [obj.model_dump(mode="json")]
-        result = await supabase.table(self.table_name).upsert(upload_data).execute()
-        return self.model(**result.data[0])
+        upload_data = [self.dump(obj)]
+        try:
+            result = await self._remote(lambda supabase: supabase.table(self.table_name).upsert(upload_data).execute())
+        except SupabaseUnavailable:
+            self._queue_upserts([obj], upload_data)
+            return obj
+        return self._saved(result.data)[0]
 
+    @instrumented
+    async def upsert_many(self, objs: List[T]) -> List[T]:
+        """
+        Upserts many objects, sending one request per `chunk_size` objects
+        :param objs: The objects to upsert
+        :return: The objects that were upserted (changes may have been made by supabase)
+        """
+        upserted = []
+        for i in range(0, len(objs), self.chunk_size):
+            chunk = objs[i:i + self.chunk_size]
+            upload_data = [self.dump(obj) for obj in chunk]
+            try:
+                result = await self._remote(
+                    lambda supabase: supabase.table(self.table_name).upsert(upload_data).execute()
+                )
+            except SupabaseUnavailable:
+                self._queue_upserts(chunk, upload_data)
+                upserted.extend(chunk)
+                continue
+            upserted.extend(self._saved(result.data))
+        return upserted
+
+    @instrumented
+    async def patch(self, object_id: str, values: Dict[str, Any]) -> T:
+        """
+        Sets some columns of one object in a single request, creating it if it doesn't exist yet (with the
+        table's column defaults for everything else). Only the given columns are written, so patches to
+        different columns of the same object can't undo each other
+        :param object_id: The ID of the object
+        :param values: The columns to set, and their new values
+        :return: The object after the change
+        """
+        upload_data = {"id": object_id, **values, "updated_at": time.time()}
+        try:
+            result = await self._remote(
+                lambda supabase: supabase.table(self.table_name).upsert(upload_data, default_to_null=False).execute()
+            )
+        except SupabaseUnavailable:
+            # The local copy gets the whole row, but only the patched columns are queued
+            obj = self.hydrate({**(self.snapshot.get(object_id) or {}), **upload_data})
+            self.snapshot.queue_patch(obj.model_dump(mode="json"), upload_data)
+            if self.cache is not None:
+                self.cache.put(obj)
+            METRICS.inc("supabase_queued_writes_total", table=self.table_name)
+            return obj
+        return self._saved(result.data)[0]
+
+    @instrumented
+    @instrumented
+    async def call(self, function: str, params: Dict[str, Any]) -> List[T]:
+        """
+        Calls a database function that writes rows of this table and returns them, for changes that must read
+        and write the row in one statement
+        :param function: The name of the function
+        :param params: Its arguments, by name
+        :return: The rows it returned
+        """
+        result = await self._remote(lambda supabase: supabase.rpc(function, params).execute())
+        return self._saved(result.data)
+
+    @instrumented
+    async def insert(self, obj: T) -> Optional[T]:
+        """
+        Inserts the object, unless one with the same ID already exists
+        :param obj: The object to insert
+        :return: The object that was inserted, or None if it already existed
+        """
+        upload_data = [self.dump(obj)]
+        result = await self._remote(
+            lambda supabase: supabase.table(self.table_name).upsert(upload_data, ignore_duplicates=True).execute()
+        )
+        return self._saved(result.data)[0] if result.data else None
+
+    @instrumented
+    async def compare_and_set(self, object_id: str, expected: Dict[str, Any], values: Dict[str, Any]) -> Optional[T]:
+        """
+        Sets some columns of an existing object, but only if its other columns still have the expected values
+        :param object_id: The ID of the object
+        :param expected: Columns and the values they must have for the update to happen
+        :param values: The columns to set, and their new values
+        :return: The object after the change, or None if it didn't match
+        """
+        values = {**values, "updated_at": time.time()}
+
+        def request(supabase: AsyncClient):
+            update = supabase.table(self.table_name).update(values).eq("id", object_id)
+            for column, value in expected.items():
+                update = update.eq(column, value)
+            return update.execute()
+
+        result = await self._remote(request)
+        return self._saved(result.data)[0] if result.data else None
+
+    @instrumented
+    async def patch_fenced(self, object_id: str, values: Dict[str, Any], token: Optional[int]) -> Optional[T]:
+        """
+        Sets some columns of an existing object on behalf of a lease holder. The object remembers the fencing
+        token of its last fenced write in its `fence` column, and writes with an older token are rejected, so
+        a leader that lost its lease without noticing can't overwrite what the new leader saved
+        :param object_id: The ID of the object
+        :param values: The columns to set, and their new values
+        :param token: The writer's fencing token, or None to write without fencing. Only pass None when there is
+                      no lease to hold, never because the lease was lost
+        :return: The object after the change, or None if a newer token wrote to it
+        :raise RowMissing: If the object doesn't exist (yet)
+        """
+        values = {**values, "updated_at": time.time()}
+
+        def request(supabase: AsyncClient):
+            if token is None:
+                return supabase.table(self.table_name).update(values).eq("id", object_id).execute()
+            return (supabase.table(self.table_name).update({**values, "fence": token})
+                    .eq("id", object_id).lte("fence", token).execute())
+
+        result = await self._remote(request)
+        if result.data:
+            return self._saved(result.data)[0]
+
+        # Nothing matched, either because of a newer fence or because there is no row to fence at all
+        existing = await self._remote(
+            lambda supabase: supabase.table(self.table_name).select("id").eq("id", object_id).execute()
+        )
+        if not existing.data:
+            raise RowMissing(f"{self.table_name} has no row {object_id}")
+        return None
+
+    @instrumented
     async def query(self, object_id: str) -> Optional[T]:
         """
         Queries the database for the object with the given ID
         :param object_id: The ID of the object to query
         :return: The object with the given ID, or None if it doesn't exist
         """
-        supabase = await self.client()
-        result = await supabase.table(self.table_name).select("*").eq("id", object_id).execute()
+        if self.cache is not None:
+            hit, obj = self.cache.get(object_id)
+            METRICS.inc("supabase_cache_total", table=self.table_name, result="hit" if hit else "miss")
+            if hit:
+                return obj
+
+        try:
+            result = await self._remote(
+                lambda supabase: supabase.table(self.table_name).select("*").eq("id", object_id).execute()
+            )
+        except SupabaseUnavailable:
+            data = self._fallback("query").get(object_id)
+            return self.hydrate(data) if data else None
+
         if not result.data:
             print(f"Object with id {object_id} not found")
             return None
+        return self._saved(result.data)[0]
 
-        return self.model(**result.data[0])
-
+    @instrumented
     async def remove(self, object_id: str):
         """
         Removes the object with the given ID from the database
         :param object_id: The ID of the object to remove
         """
-        supabase = await self.client()
-        await supabase.table(self.table_name).delete().eq("id", object_id).execute()
+        async def request(supabase: AsyncClient):
+            await supabase.table(self.table_name).delete().eq("id", object_id).execute()
+            await self._bury(supabase, [object_id])
+
+        try:
+            await self._remote(request)
+        except SupabaseUnavailable:
+            self._queue_removals([object_id])
+            return
+        if self.cache is not None:
+            self.cache.discard(object_id)
+        if self.snapshot is not None:
+            self.snapshot.delete([object_id])
+
+    @instrumented
+    async def remove_many(self, object_ids: List[str]):
+        """
+        Removes every object with one of the given IDs, sending one request per `chunk_size` IDs
+        :param object_ids: The IDs of the objects to remove
+        """
+        for i in range(0, len(object_ids), self.chunk_size):
+            chunk = object_ids[i:i + self.chunk_size]
+
+            async def request(supabase: AsyncClient):
+                await supabase.table(self.table_name).delete().in_("id", chunk).execute()
+                await self._bury(supabase, chunk)
 
+            try:
+                await self._remote(request)
+            except SupabaseUnavailable:
+                self._queue_removals(chunk)
+                continue
+            if self.cache is not None:
+                for object_id in chunk:
+                    self.cache.discard(object_id)
+            if self.snapshot is not None:
+                self.snapshot.delete(chunk)
+
+    @instrumented
     async def list(self) -> List[T]:
         """
         Lists all objects in the table
         :return: A list of all objects in the table
         """
-        supabase = await self.client()
-        result = await supabase.table(self.table_name).select("*").execute()
-        return [self.model(**data) for data in result.data]
+        if self.cache is not None:
+            cached = self.cache.values()
+            METRICS.inc("supabase_cache_total", table=self.table_name, result="miss" if cached is None else "hit")
+            if cached is not None:
+                return cached
+
+        try:
+            rows = [data async for data in self.scan()]
+        except SupabaseUnavailable:
+            return [self.hydrate(data) for data in self._fallback("list").load()]
+
+        objs = [self.hydrate(data) for data in rows]
+        if self.cache is not None:
+            self.cache.fill(objs)
+            self._watermark = self._latest(rows)
+        if self.snapshot is not None:
+            self.snapshot.replace(rows)
+        return objs
+
+    async def scan(
+            self,
+            columns: Optional[List[str]] = None,
+            since: Optional[float] = None,
+            page_size: Optional[int] = None,
+            filters: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[dict]:
+        """
+        Streams rows of the table, ordered by ID, one page at a time. Each page starts after the last ID of the
+        one before (keyset pagination), so a page costs the same however deep into the table it is
+        :param columns: The columns to read, or None for all of them. The ID and `updated_at` are always read
+        :param since: Only read rows written at or after this unix timestamp
+        :param page_size: Rows per request, `page_size` by default. It must not be more than supabase's row cap
+        :param filters: Column names and the values they must have
+        :return: The rows, as returned by supabase
+        :raise SupabaseUnavailable: If supabase can't be reached
+        """
+        page_size = page_size or self.page_size
+        select = "*" if columns is None else ",".join(dict.fromkeys(["id", "updated_at", *columns]))
+        last_id = None
+        while True:
+            def request(supabase: AsyncClient):
+                query = supabase.table(self.table_name).select(select).order("id").limit(page_size)
+                if since is not None:
+                    query = query.gte("updated_at", since)
+                for column, value in (filters or {}).items():
+                    query = query.eq(column, value)
+                if last_id is not None:
+                    query = query.gt("id", last_id)
+                return query.execute()
+
+            result = await self._remote(request)
+            for data in result.data:
+                yield data
+            if len(result.data) < page_size:
+                return
+            last_id = result.data[-1]["id"]
+
+    async def copy(self) -> AsyncIterator[dict]:
+        """
+        Streams every row of the table, like `scan`, and replaces the snapshot with them once the last one was
+        read, so the table is copied without ever being held in memory at once
+        :return: The rows, as returned by supabase
+        :raise SupabaseUnavailable: If supabase can't be reached
+        """
+        if self.snapshot is None:
+            async for data in self.scan():
+                yield data
+            return
+
+        self.snapshot.unstage()
+        page = []
+        async for data in self.scan():
+            yield data
+            page.append(data)
+            if len(page) >= self.page_size:
+                self.snapshot.stage(page)
+                page = []
+        self.snapshot.stage(page)
+        self.snapshot.swap()
+
+    @instrumented
+    async def list_since(self, watermark: Optional[float], columns: Optional[List[str]] = None) -> TableDelta:
+        """
+        Lists the rows written since the watermark, and the IDs of the rows removed since, so polling costs
+        requests in proportion to what changed rather than to the size of the table. Rows written up to
+        `sync_overlap` seconds before the watermark are read again, in case a writer's clock is behind
+        :param watermark: The watermark of the previous delta, or None to list the whole table
+        :param columns: The columns to read, or None for all of them. The ID and `updated_at` are always read.
+                        Only deltas of whole rows are applied to the snapshot
+        :return: The changes, and the watermark to pass next time
+        :raise SupabaseUnavailable: If supabase can't be reached
+        """
+        # Removals older than the tombstones we keep can't be seen anymore, so start over
+        full = watermark is None or watermark < time.time() - self.tombstone_retention
+        since = None if full else watermark - self.sync_overlap
+        rows = [data async for data in self.scan(columns, since=since)]
+        if full:
+            if self.snapshot is not None and columns is None:
+                self.snapshot.replace(rows)
+            return TableDelta(rows=rows, watermark=self._latest(rows), full=True)
+
+        result = await self._remote(
+            lambda supabase: supabase.table(TOMBSTONES_TABLE).select("object_id,updated_at")
+            .eq("table_name", self.table_name).gte("updated_at", since).execute()
+        )
+        # A row that was written again after it was removed is back
+        written = {data["id"]: data.get("updated_at") or 0 for data in rows}
+        removed = {
+            tombstone["object_id"] for tombstone in result.data
+            if tombstone["updated_at"] >= written.get(tombstone["object_id"], 0)
+        }
+        rows = [data for data in rows if data["id"] not in removed]
+        if self.snapshot is not None and columns is None:
+            self.snapshot.put(rows)
+            self.snapshot.delete(removed)
+        return TableDelta(rows=rows, removed=list(removed), watermark=self._latest(rows + result.data, watermark))
+
+    @instrumented
+    async def sync(self) -> List[T]:
+        """
+        Lists all objects in the table, like `list`, but never from a stale cache. Once the cache holds the
+        whole table, only the rows written or removed since are downloaded and applied to it
+        :return: A list of all objects in the table
+        """
+        if self.cache is None or self._watermark is None:
+            self.invalidate()
+            return await self.list()
+
+        try:
+            delta = await self.list_since(self._watermark)
+        except SupabaseUnavailable:
+            return [self.hydrate(data) for data in self._fallback("sync").load()]
+
+        objs = [self.hydrate(data) for data in delta.rows]
+        if delta.full:
+            self.cache.fill(objs)
+        else:
+            self.cache.apply(objs, delta.removed)
+        self._watermark = delta.watermark
+        METRICS.inc("supabase_sync_rows_total", value=len(delta.rows) + len(delta.removed), table=self.table_name)
+        return self.cache.values()
+
+    @instrumented
+    async def list_ids(self, **filters) -> List[str]:
+        """
+        Lists the IDs of the objects whose columns equal the given values, filtered by the database. The IDs
+        are read in pages, so there can be more of them than supabase returns at once
+        :param filters: Column names and the values they must have
+        :return: The matching IDs
+        """
+        try:
+            return [data["id"] async for data in self.scan(columns=["id"], filters=filters)]
+        except SupabaseUnavailable:
+            rows = self._fallback("list_ids").load()
+            return [data["id"] for data in rows if all(data.get(column) == value for column, value in filters.items())]
+
+    def invalidate(self, object_id: Optional[str] = None):
+        """
+        Drops cached data so the next read goes to the database
+        :param object_id: The ID of the object to forget, or None to forget the whole table
+        """
+        # The cache no longer holds the whole table to apply changes to
+        self._watermark = None
+        if self.cache is not None:
+            self.cache.invalidate(object_id)
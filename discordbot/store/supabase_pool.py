@@ -0,0 +1,84 @@
+import asyncio
+from typing import Dict, Optional, Tuple
+
+import httpx
+from supabase._async.client import AsyncClient, create_client
+
+from discordbot.settings import SETTINGS
+
+
+class SupabaseClientPool:
+    """
+    Lazily creates a single Supabase client and shares it (and its HTTP connection pool) between
+    every SupabaseManager that talks to the same project, so keep-alive connections get reused
+    """
+
+    def __init__(
+            self,
+            api_url: str = SETTINGS.supabase_api_url,
+            api_key: str = SETTINGS.supabase_api_key,
+            pool_size: int = SETTINGS.supabase_pool_size
+    ):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.pool_size = pool_size
+        self._client: Optional[AsyncClient] = None
+        self._lock = asyncio.Lock()
+
+    async def client(self) -> AsyncClient:
+        """
+        Returns the shared async client, creating it on first use
+        :return: The async client
+        """
+        if self._client is None:
+            async with self._lock:
+                if self._client is None:
+                    self._client = await self._create_client()
+        return self._client
+
+    async def _create_client(self) -> AsyncClient:
+        client = await create_client(self.api_url, self.api_key)
+
+        # The postgrest session supabase builds has no way to size its pool, so swap it out for
+        # one that has the same configuration and our connection limits
+        postgrest = client.postgrest
+        default_session = postgrest.session
+        postgrest.session = httpx.AsyncClient(
+            base_url=default_session.base_url,
+            headers=default_session.headers,
+            timeout=default_session.timeout,
+            follow_redirects=True,
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=self.pool_size,
+                max_keepalive_connections=self.pool_size,
+            ),
+        )
+        await default_session.aclose()
+        return client
+
+    async def close(self):
+        """
+        Closes the pooled connections. The next call to `client()` will create a fresh client
+        """
+        if self._client is None:
+            return
+
+        client, self._client = self._client, None
+        await client.postgrest.aclose()
+
+
+_POOLS: Dict[Tuple[str, str], SupabaseClientPool] = {}
+
+
+def get_pool(api_url: str = SETTINGS.supabase_api_url, api_key: str = SETTINGS.supabase_api_key) -> SupabaseClientPool:
+    """
+    Returns the process-wide pool for the given project, creating it if needed
+    :param api_url: The Supabase project URL
+    :param api_key: The Supabase API key
+    :return: The shared pool
+    """
+    key = (api_url, api_key)
+    if key not in _POOLS:
+        _POOLS[key] = SupabaseClientPool(api_url, api_key)
+    return _POOLS[key]
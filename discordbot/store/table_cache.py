@@ -0,0 +1,87 @@
+import time
+from typing import Dict, Generic, List, Optional, Tuple, TypeVar
+
+from discordbot.models import supabase_models
+
+T = TypeVar("T", bound=supabase_models.SupabaseModel)
+
+
+class TableCache(Generic[T]):
+    """
+    An id-keyed, in-memory copy of a supabase table. Entries expire after `ttl` seconds, and the whole table
+    is only considered known after a full `fill()` that is still within the TTL
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: Dict[str, Tuple[T, float]] = {}
+        self._filled_at: Optional[float] = None
+
+    def _is_fresh(self, timestamp: Optional[float]) -> bool:
+        return timestamp is not None and time.monotonic() - timestamp < self.ttl
+
+    @property
+    def is_complete(self) -> bool:
+        """
+        Whether the cache holds every row of the table, so a missing key means a missing row
+        """
+        return self._is_fresh(self._filled_at)
+
+    def get(self, object_id: str) -> Tuple[bool, Optional[T]]:
+        """
+        Looks up a single row
+        :param object_id: The ID of the row
+        :return: A (hit, object) tuple. On a hit the object may be None, meaning the row does not exist
+        """
+        entry = self._entries.get(object_id)
+        if entry is not None and self._is_fresh(entry[1]):
+            return True, entry[0].model_copy()
+        if self.is_complete:
+            return True, None
+        return False, None
+
+    def values(self) -> Optional[List[T]]:
+        """
+        :return: Every row in the table, or None if the cache does not hold the full table
+        """
+        if not self.is_complete:
+            return None
+        return [obj.model_copy() for obj, _ in self._entries.values()]
+
+    def fill(self, objs: List[T]):
+        """
+        Replaces the cache with the full contents of the table
+        """
+        now = time.monotonic()
+        self._entries = {obj.id: (obj.model_copy(), now) for obj in objs}
+        self._filled_at = now
+
+    def apply(self, objs: List[T], removed: List[str]):
+        """
+        Brings a copy of the full table up to date with the rows that changed or were removed since
+        """
+        now = time.monotonic()
+        for obj in objs:
+            self._entries[obj.id] = (obj.model_copy(), now)
+        for object_id in removed:
+            self._entries.pop(object_id, None)
+        self._entries = {object_id: (obj, now) for object_id, (obj, _) in self._entries.items()}
+        self._filled_at = now
+
+    def put(self, obj: T):
+        self._entries[obj.id] = (obj.model_copy(), time.monotonic())
+
+    def discard(self, object_id: str):
+        self._entries.pop(object_id, None)
+
+    def invalidate(self, object_id: Optional[str] = None):
+        """
+        Forgets a single row, or the whole table if no ID is given
+        """
+        if object_id is None:
+            self._entries.clear()
+            self._filled_at = None
+        else:
+            self._entries.pop(object_id, None)
+            # We can no longer answer "is this row missing?" from memory
+            self._filled_at = None
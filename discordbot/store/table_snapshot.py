@@ -0,0 +1,204 @@
+import json
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class TableSnapshot:
+    """
+    A copy of one supabase table in a local SQLite file, so the bot can start warm and keep reading while
+    supabase is unreachable. Writes made while offline are kept in order until they can be replayed
+    """
+
+    def __init__(self, path: str, table_name: str):
+        self.table_name = table_name
+        self._db = sqlite3.connect(path)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS rows (
+                table_name TEXT NOT NULL,
+                id TEXT NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (table_name, id)
+            );
+            CREATE TABLE IF NOT EXISTS staged_rows (
+                table_name TEXT NOT NULL,
+                id TEXT NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (table_name, id)
+            );
+            CREATE TABLE IF NOT EXISTS synced (
+                table_name TEXT PRIMARY KEY,
+                synced_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS pending_writes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                table_name TEXT NOT NULL,
+                op TEXT NOT NULL,
+                id TEXT NOT NULL,
+                data TEXT
+            );
+        """)
+        self._db.commit()
+
+    @property
+    def synced_at(self) -> Optional[float]:
+        """
+        The unix timestamp of the last time the whole table was copied, or None if it never was
+        """
+        row = self._db.execute("SELECT synced_at FROM synced WHERE table_name = ?", (self.table_name,)).fetchone()
+        return row[0] if row else None
+
+    def load(self) -> Optional[List[dict]]:
+        """
+        :return: Every row in the snapshot, or None if the table was never copied
+        """
+        if self.synced_at is None:
+            return None
+        rows = self._db.execute("SELECT data FROM rows WHERE table_name = ?", (self.table_name,))
+        return [json.loads(data) for data, in rows]
+
+    def get(self, object_id: str) -> Optional[dict]:
+        row = self._db.execute(
+            "SELECT data FROM rows WHERE table_name = ? AND id = ?", (self.table_name, object_id)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def replace(self, rows: List[dict]):
+        """
+        Replaces the snapshot with the full contents of the table
+        """
+        with self._db:
+            self._db.execute("DELETE FROM rows WHERE table_name = ?", (self.table_name,))
+            self._db.executemany(
+                "INSERT INTO rows (table_name, id, data) VALUES (?, ?, ?)",
+                ((self.table_name, row["id"], json.dumps(row)) for row in rows)
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO synced (table_name, synced_at) VALUES (?, ?)", (self.table_name, time.time())
+            )
+
+    def stage(self, rows: Iterable[dict]):
+        """
+        Adds rows to a new copy of the table, which replaces the snapshot on `swap`. This way a big table can be
+        copied one page at a time, and a copy that fails halfway never replaces a complete one
+        """
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO staged_rows (table_name, id, data) VALUES (?, ?, ?)",
+                ((self.table_name, row["id"], json.dumps(row)) for row in rows)
+            )
+
+    def unstage(self):
+        """
+        Forgets the rows staged so far
+        """
+        with self._db:
+            self._db.execute("DELETE FROM staged_rows WHERE table_name = ?", (self.table_name,))
+
+    def swap(self):
+        """
+        Replaces the snapshot with the staged rows, once the whole table was staged
+        """
+        with self._db:
+            self._db.execute("DELETE FROM rows WHERE table_name = ?", (self.table_name,))
+            self._db.execute(
+                "INSERT INTO rows (table_name, id, data) SELECT table_name, id, data FROM staged_rows "
+                "WHERE table_name = ?", (self.table_name,)
+            )
+            self._db.execute("DELETE FROM staged_rows WHERE table_name = ?", (self.table_name,))
+            self._db.execute(
+                "INSERT OR REPLACE INTO synced (table_name, synced_at) VALUES (?, ?)", (self.table_name, time.time())
+            )
+
+    def put(self, rows: Iterable[dict]):
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO rows (table_name, id, data) VALUES (?, ?, ?)",
+                ((self.table_name, row["id"], json.dumps(row)) for row in rows)
+            )
+
+    def delete(self, object_ids: Iterable[str]):
+        with self._db:
+            self._db.executemany(
+                "DELETE FROM rows WHERE table_name = ? AND id = ?",
+                ((self.table_name, object_id) for object_id in object_ids)
+            )
+
+    def queue_upserts(self, rows: List[dict]):
+        """
+        Applies upserts to the snapshot, and remembers them to be replayed on supabase
+        """
+        self.put(rows)
+        with self._db:
+            self._db.executemany(
+                "INSERT INTO pending_writes (table_name, op, id, data) VALUES (?, 'upsert', ?, ?)",
+                ((self.table_name, row["id"], json.dumps(row)) for row in rows)
+            )
+
+    def queue_removals(self, object_ids: List[str]):
+        """
+        Applies removals to the snapshot, and remembers them to be replayed on supabase
+        """
+        self.delete(object_ids)
+        with self._db:
+            self._db.executemany(
+                "INSERT INTO pending_writes (table_name, op, id) VALUES (?, 'remove', ?)",
+                ((self.table_name, object_id) for object_id in object_ids)
+            )
+
+    def queue_patch(self, row: dict, values: dict):
+        """
+        Applies a patch to the snapshot, and remembers just the patched columns to be replayed on supabase, so
+        the replay can't overwrite columns that were changed there in the meantime
+        :param row: The whole row after the patch, as far as we know it
+        :param values: The patched columns, with the row's ID
+        """
+        self.put([row])
+        with self._db:
+            self._db.execute(
+                "INSERT INTO pending_writes (table_name, op, id, data) VALUES (?, 'patch', ?, ?)",
+                (self.table_name, row["id"], json.dumps(values))
+            )
+
+    def has_pending_writes(self) -> bool:
+        row = self._db.execute("SELECT 1 FROM pending_writes WHERE table_name = ? LIMIT 1", (self.table_name,))
+        return row.fetchone() is not None
+
+    def pending_writes(self) -> Tuple[int, List[dict], List[str], List[dict]]:
+        """
+        Collapses the queued writes into the final state of each row. A patch after an upsert is merged into the
+        upserted row, and a patch after a removal is replayed after it, since a patch creates missing rows
+        :return: The sequence number of the last write, the rows to upsert, the IDs to remove, and the patches
+                 to apply after those
+        """
+        last_seq = 0
+        # Per row, whether it is removed first, and the whole row to upsert or the columns to patch after that
+        final: Dict[str, Tuple[bool, Optional[str], Optional[dict]]] = {}
+        writes = self._db.execute(
+            "SELECT seq, op, id, data FROM pending_writes WHERE table_name = ? ORDER BY seq", (self.table_name,)
+        )
+        for seq, op, object_id, data in writes:
+            last_seq = seq
+            removed, previous_op, previous = final.get(object_id, (False, None, None))
+            if op == "patch" and previous_op is not None:
+                final[object_id] = (removed, previous_op, {**previous, **json.loads(data)})
+            elif op == "patch":
+                final[object_id] = (removed, "patch", json.loads(data))
+            elif op == "upsert":
+                final[object_id] = (False, "upsert", json.loads(data))
+            else:
+                final[object_id] = (True, None, None)
+        upserts = [row for _, op, row in final.values() if op == "upsert"]
+        removals = [object_id for object_id, (removed, _, _) in final.items() if removed]
+        patches = [values for _, op, values in final.values() if op == "patch"]
+        return last_seq, upserts, removals, patches
+
+    def ack(self, last_seq: int):
+        """
+        Forgets the queued writes up to and including `last_seq`, once they have been replayed
+        """
+        with self._db:
+            self._db.execute("DELETE FROM pending_writes WHERE table_name = ? AND seq <= ?", (self.table_name, last_seq))
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,71 @@
+from typing import Dict, Generic, Optional, Set, TypeVar
+
+from discordbot.models import supabase_models
+from discordbot.settings import SETTINGS
+from discordbot.store.supabase_manager import SupabaseManager
+from discordbot.util.flush_timer import FlushTimer
+
+T = TypeVar("T", bound=supabase_models.SupabaseModel)
+
+
+class WriteBuffer(Generic[T]):
+    """
+    A write-behind buffer in front of a SupabaseManager. Writes to the same ID within `window` seconds
+    collapse into the latest one, and everything pending is flushed together as one batch
+    """
+
+    def __init__(self, manager: SupabaseManager[T], window: float = SETTINGS.supabase_write_window):
+        self.manager = manager
+        self.window = window
+        self._upserts: Dict[str, T] = {}
+        self._removals: Set[str] = set()
+        self._timer = FlushTimer(self.flush, window, f"writes to {manager.table_name}")
+
+    def upsert(self, obj: T):
+        """
+        Queues the object to be upserted, replacing any pending write for the same ID
+        """
+        self._removals.discard(obj.id)
+        self._upserts[obj.id] = obj
+        self._timer.schedule()
+
+    def remove(self, object_id: str):
+        """
+        Queues the object with the given ID to be removed, replacing any pending write for it
+        """
+        self._upserts.pop(object_id, None)
+        self._removals.add(object_id)
+        self._timer.schedule()
+
+    def pending(self, object_id: str) -> Optional[T]:
+        """
+        :return: The object waiting to be upserted with the given ID, if there is one
+        """
+        return self._upserts.get(object_id)
+
+    async def flush(self):
+        """
+        Sends every pending write to supabase. If that fails, the writes stay queued for a retry and the
+        error is raised
+        """
+        upserts, self._upserts = self._upserts, {}
+        removals, self._removals = self._removals, set()
+        try:
+            await self.manager.upsert_many(list(upserts.values()))
+            await self.manager.remove_many(list(removals))
+        except Exception:
+            # Retry later, unless a newer write for the same ID came in while we were flushing
+            for object_id, obj in upserts.items():
+                if object_id not in self._upserts and object_id not in self._removals:
+                    self._upserts[object_id] = obj
+            for object_id in removals:
+                if object_id not in self._upserts:
+                    self._removals.add(object_id)
+            self._timer.schedule()
+            raise
+
+    async def close(self):
+        """
+        Flushes anything still pending and stops the timer
+        """
+        await self._timer.close()
@@ -0,0 +1,144 @@
+import asyncio
+import time
+from typing import Callable, Iterable, Optional, Union
+
+import discord
+from discord.abc import Messageable
+from pydantic import BaseModel
+
+from discordbot.settings import SETTINGS
+from discordbot.util.metrics import METRICS
+
+
+class DeliveryReport(BaseModel):
+    """
+    The outcome of sending one message to many recipients
+    """
+
+    sent: int = 0
+    skipped: int = 0
+    failed: int = 0
+    elapsed: float = 0.0
+
+    def __str__(self):
+        return f"{self.sent} sent, {self.skipped} skipped, {self.failed} failed in {self.elapsed:.1f}s"
+
+
+class TokenBucket:
+    """
+    Allows `rate` acquisitions per second on average, with bursts of up to `capacity`
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    async def pause(self, seconds: float):
+        """
+        Holds back every sender, used when Discord tells us to slow down
+        """
+        async with self._lock:
+            await asyncio.sleep(seconds)
+            self._tokens = 0
+            self._updated_at = time.monotonic()
+
+
+class DMFanOut:
+    """
+    Sends the same DM to many recipients with a bounded number of workers, a shared rate limit, and
+    per-recipient error handling, so one closed inbox doesn't stop the rest of the wave
+    """
+
+    def __init__(
+            self,
+            workers: int = SETTINGS.dm_workers,
+            rate: float = SETTINGS.dm_rate_per_second,
+            burst: float = SETTINGS.dm_burst,
+            max_retries: int = 3
+    ):
+        self.workers = workers
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+
+    async def send(
+            self,
+            recipients: Iterable[Optional[Messageable]],
+            content: Union[str, Callable[[Messageable], str]],
+            on_result: Optional[Callable[[Messageable, bool], None]] = None
+    ) -> DeliveryReport:
+        """
+        Sends `content` to every recipient. Recipients that are None (for example members that left) are skipped
+        :param recipients: Who to message
+        :param content: The message to send, or a function that writes the message for each recipient
+        :param on_result: Called with each recipient and whether their message was sent
+        :return: How many messages were sent, skipped or failed, and how long it took
+        """
+        report = DeliveryReport()
+        start = time.monotonic()
+
+        queue: asyncio.Queue[Messageable] = asyncio.Queue()
+        for recipient in recipients:
+            if recipient is None:
+                report.skipped += 1
+            else:
+                queue.put_nowait(recipient)
+
+        async def worker():
+            while not queue.empty():
+                recipient = queue.get_nowait()
+                message = content(recipient) if callable(content) else content
+                sent = await self._send_one(recipient, message)
+                if sent:
+                    report.sent += 1
+                else:
+                    report.failed += 1
+                if on_result is not None:
+                    on_result(recipient, sent)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.workers, queue.qsize()))))
+        report.elapsed = time.monotonic() - start
+
+        METRICS.inc("dm_total", report.sent, result="sent")
+        METRICS.inc("dm_total", report.skipped, result="skipped")
+        METRICS.inc("dm_total", report.failed, result="failed")
+        return report
+
+    async def _send_one(self, recipient: Messageable, content: str) -> bool:
+        for _ in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            try:
+                await recipient.send(content=content)
+                return True
+            except discord.RateLimited as e:
+                retry_after = e.retry_after
+            except discord.Forbidden:
+                # They have DMs from server members turned off, retrying won't help
+                return False
+            except discord.HTTPException as e:
+                if e.status != 429:
+                    print(f"Could not send a DM to {recipient}: {e}")
+                    return False
+                retry_after = float(e.response.headers.get("Retry-After", 1))
+            except Exception as e:
+                print(f"Could not send a DM to {recipient}: {e}")
+                return False
+
+            print(f"Rate limited while sending DMs, retrying in {retry_after:.1f}s")
+            METRICS.inc("dm_rate_limited_total")
+            await self.bucket.pause(retry_after)
+
+        return False
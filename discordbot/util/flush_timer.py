@@ -0,0 +1,66 @@
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+from discordbot.util.metrics import METRICS
+
+
+class FlushTimer:
+    """
+    Calls `flush` `window` seconds after something was first queued, so everything queued within the window
+    goes out together. Nothing awaits the timer, so the errors a flush raises are logged here, as failing to
+    flush `description`. The flush itself is expected to keep what it couldn't send queued, and `schedule` a
+    retry. With a `handler`, flushes are timed under that name in `gateway_handler_seconds`
+    """
+
+    def __init__(
+            self,
+            flush: Callable[[], Awaitable[None]],
+            window: float,
+            description: str,
+            handler: Optional[str] = None
+    ):
+        self.flush = flush
+        self.window = window
+        self.description = description
+        self.handler = handler
+        self._task: Optional[asyncio.Task] = None
+
+    def schedule(self):
+        """
+        Starts the timer, unless it is already running
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        # Whatever is queued while this flush runs is gathered for the next one
+        self._task = None
+        try:
+            await self._flush()
+        except Exception as e:
+            print(f"Failed to flush {self.description}, will retry: {e!r}")
+
+    async def _flush(self):
+        if self.handler is None:
+            await self.flush()
+            return
+        with METRICS.timer("gateway_handler_seconds", handler=self.handler):
+            await self.flush()
+
+    def cancel(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def close(self):
+        """
+        Stops the timer and flushes whatever is still queued
+        """
+        self.cancel()
+        try:
+            await self._flush()
+        except Exception as e:
+            print(f"Lost {self.description} while closing: {e!r}")
+            # The failed flush scheduled a retry that won't get to run
+            self.cancel()
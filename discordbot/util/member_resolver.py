@@ -0,0 +1,87 @@
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Tuple
+
+import discord
+from discord.abc import Messageable
+
+from discordbot.settings import SETTINGS
+
+# The most user ids Discord accepts in one member request
+CHUNK_SIZE = 100
+
+
+class DirectMessage:
+    """
+    Sends a DM to a user we only know the ID of, opening the DM channel when the first message is sent
+    """
+
+    def __init__(self, client: discord.Client, user_id: int):
+        self.client = client
+        self.id = user_id
+        self.mention = f"<@{user_id}>"
+
+    async def send(self, content: str):
+        channel = await self.client.create_dm(discord.Object(id=self.id))
+        return await channel.send(content)
+
+
+class MemberResolver:
+    """
+    Finds the members that notifications are sent to. Normally they are looked up in the member cache. In lean
+    mode there is no member cache, so they are requested from Discord in chunks, and only the most recently
+    used `capacity` members are kept around
+    """
+
+    def __init__(
+            self,
+            client: discord.Client,
+            lean: bool = SETTINGS.lean_member_cache,
+            capacity: int = SETTINGS.member_cache_size
+    ):
+        self.client = client
+        self.lean = lean
+        self.capacity = capacity
+        self._members: OrderedDict[Tuple[int, int], Messageable] = OrderedDict()
+
+    def _remember(self, key: Tuple[int, int], member: Messageable):
+        self._members[key] = member
+        self._members.move_to_end(key)
+        while len(self._members) > self.capacity:
+            self._members.popitem(last=False)
+
+    async def resolve(self, guild_id: int, user_ids: Iterable[int]) -> Dict[int, Messageable]:
+        """
+        :param guild_id: The guild they should be members of
+        :param user_ids: The users to look up
+        :return: The ones that are still members of the guild, by ID
+        """
+        guild = self.client.get_guild(guild_id)
+        if guild is None:
+            return {}
+        if not self.lean:
+            members = {user_id: guild.get_member(user_id) for user_id in user_ids}
+            return {user_id: member for user_id, member in members.items() if member is not None}
+
+        found: Dict[int, Messageable] = {}
+        missing: List[int] = []
+        for user_id in user_ids:
+            if (guild_id, user_id) in self._members:
+                self._members.move_to_end((guild_id, user_id))
+                found[user_id] = self._members[(guild_id, user_id)]
+            else:
+                missing.append(user_id)
+
+        for i in range(0, len(missing), CHUNK_SIZE):
+            chunk = missing[i:i + CHUNK_SIZE]
+            try:
+                members = await guild.query_members(user_ids=chunk, limit=len(chunk), cache=False)
+            except (asyncio.TimeoutError, discord.HTTPException, discord.ClientException) as e:
+                # We can't check whether they're still here, but we can still reach them by ID
+                print(f"Could not request {len(chunk)} members, sending to them by ID: {e!r}")
+                found.update((user_id, DirectMessage(self.client, user_id)) for user_id in chunk)
+                continue
+            for member in members:
+                found[member.id] = member
+                self._remember((guild_id, member.id), member)
+        return found
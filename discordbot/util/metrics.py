@@ -0,0 +1,176 @@
+import asyncio
+import bisect
+import json
+import time
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+from discordbot.settings import SETTINGS
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf"))
+
+
+class _Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.buckets[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class _Timer:
+    def __init__(self, metrics: "Metrics", name: str, labels: Dict[str, str]):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        if exc_type is not None:
+            self.metrics.inc(f"{self.name.removesuffix('_seconds')}_errors_total", **self.labels)
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{key}="{value}"' for key, value in labels] + ([extra] if extra else [])
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Metrics:
+    """
+    Counters and latency histograms, exposed as Prometheus text on a local port and/or as a periodic
+    structured log line. When neither is configured, every call returns straight away
+    """
+
+    def __init__(self, port: Optional[int] = None, log_interval: Optional[float] = None):
+        self.port = port
+        self.log_interval = log_interval
+        self.enabled = bool(port or log_interval)
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, _Histogram]] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._runner: Optional[web.AppRunner] = None
+
+    def inc(self, name: str, value: float = 1, **labels: str):
+        """
+        Increases a counter
+        """
+        if not self.enabled:
+            return
+        series = self._counters.setdefault(name, {})
+        key = _labels(labels)
+        series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels: str):
+        """
+        Records a duration in a histogram
+        """
+        if not self.enabled:
+            return
+        self._histograms.setdefault(name, {}).setdefault(_labels(labels), _Histogram()).observe(seconds)
+
+    def timer(self, name: str, **labels: str):
+        """
+        A context manager that records how long its body took in the `name` histogram. If the body raises,
+        the matching `_errors_total` counter is increased too
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels)
+
+    def render(self) -> str:
+        """
+        :return: Every metric in the Prometheus text format
+        """
+        lines = []
+        for name, series in sorted(self._counters.items()):
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in series.items():
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        for name, series in sorted(self._histograms.items()):
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.buckets):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else bound
+                    bucket_labels = _format_labels(labels, f'le="{le}"')
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        :return: A compact snapshot, with the count and mean of each histogram
+        """
+        snapshot = {}
+        for name, series in self._counters.items():
+            for labels, value in series.items():
+                snapshot[f"{name}{_format_labels(labels)}"] = {"value": value}
+        for name, series in self._histograms.items():
+            for labels, histogram in series.items():
+                snapshot[f"{name}{_format_labels(labels)}"] = {
+                    "count": histogram.count,
+                    "mean": round(histogram.sum / histogram.count, 6),
+                }
+        return snapshot
+
+    async def start(self):
+        """
+        Starts the configured exporters
+        """
+        if self.port:
+            app = web.Application()
+            app.router.add_get("/metrics", self._handle_scrape)
+            self._runner = web.AppRunner(app)
+            await self._runner.setup()
+            await web.TCPSite(self._runner, "127.0.0.1", self.port).start()
+            print(f"Serving metrics on http://127.0.0.1:{self.port}/metrics")
+        if self.log_interval:
+            self._tasks.append(asyncio.create_task(self._log_periodically()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks.clear()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle_scrape(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.render(), content_type="text/plain")
+
+    async def _log_periodically(self):
+        while True:
+            await asyncio.sleep(self.log_interval)
+            print(json.dumps({"metrics": self.summary()}))
+
+
+METRICS = Metrics(port=SETTINGS.metrics_port, log_interval=SETTINGS.metrics_log_interval)
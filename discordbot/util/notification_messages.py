@@ -0,0 +1,28 @@
+from typing import List
+
+from discordbot.models.event_models import Event
+
+FOOTER = "\n-# You can disable these notifications by using `/notifications`"
+
+
+def event_notification(event: Event) -> str:
+    """
+    The DM sent when one event is coming up
+    """
+    return f"We have an [event]({event.discord_link}) coming up! Make sure to check it out!{FOOTER}"
+
+
+def event_line(event: Event) -> str:
+    """
+    How the event is listed in a digest
+    """
+    return f"[{event.name}]({event.discord_link}) <t:{event.start_time}:R>"
+
+
+def digest(lines: List[str]) -> str:
+    """
+    The DM sent when several events are coming up at once
+    :param lines: One `event_line` per event
+    """
+    listed = "\n".join(f"- {line}" for line in lines)
+    return f"We have {len(lines)} events coming up! Make sure to check them out!\n{listed}{FOOTER}"
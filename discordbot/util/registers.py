@@ -30,5 +30,16 @@ class SupabaseRegister:
             raise ValueError(f"Key {key} already exists in register")
         self.__register[key] = value
 
+    async def close(self):
+        """
+        Closes the connection pools and snapshots used by the registered managers
+        """
+        pools = {id(manager.pool): manager.pool for manager in self.__register.values()}
+        for pool in pools.values():
+            await pool.close()
+        for manager in self.__register.values():
+            if manager.snapshot is not None:
+                manager.snapshot.close()
+
     def __str__(self):
         return f"SupabaseRegister({self.__register})"
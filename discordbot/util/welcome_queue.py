@@ -0,0 +1,89 @@
+import time
+from typing import Dict, List, Optional, Tuple
+
+import discord
+
+from discordbot.settings import SETTINGS
+from discordbot.store.scheduled_event_mirror import ScheduledEventMirror
+from discordbot.util.dm_fanout import DMFanOut
+from discordbot.util.flush_timer import FlushTimer
+
+
+def next_event(
+        events: List[discord.ScheduledEvent],
+        now: Optional[float] = None
+) -> Optional[discord.ScheduledEvent]:
+    """
+    :param events: The scheduled events of a guild
+    :param now: The current unix timestamp
+    :return: The scheduled event that starts soonest, or None if nothing is coming up
+    """
+    now = time.time() if now is None else now
+    upcoming = [
+        event for event in events
+        if event.start_time.timestamp() > now and event.status == discord.EventStatus.scheduled
+    ]
+    return min(upcoming, key=lambda event: event.start_time, default=None)
+
+
+def welcome_message(member: discord.abc.User, event: Optional[discord.ScheduledEvent]) -> str:
+    content = (f"Welcome {member.mention} to **AI Society**! We're happy to have you here.\n\n"
+               f"We have a little notification system to help keep you up to date with events. "
+               f"If you run the command `/notifications`, you can choose to be notified about events "
+               f"24 hours, and 1 hour before they start (We recommend turning on both).")
+
+    if event:
+        content += (f"\n\nIt looks like we have an [event coming up]({event.url}). "
+                    f"Make sure to check it out! Use <#1228852708677783572> if you would like to "
+                    f"ask any questions or get help.")
+    else:
+        content += "\n\nWe don't have any events coming up right now, but stay tuned!"
+    return content
+
+
+class WelcomeQueue:
+    """
+    Collects the members that join within `window` seconds and welcomes them together, looking up the next
+    event once per window instead of once per member. The window also means we don't ping anyone right away
+    """
+
+    def __init__(self, sender: DMFanOut, events: ScheduledEventMirror, window: float = SETTINGS.welcome_window):
+        self.sender = sender
+        self.events = events
+        self.window = window
+        # Keyed by guild too, so someone joining two guilds is welcomed to both
+        self._pending: Dict[Tuple[int, int], discord.Member] = {}
+        self._timer = FlushTimer(self.flush, window, "new members to welcome", handler="welcome_flush")
+
+    def add(self, member: discord.Member):
+        self._pending[(member.guild.id, member.id)] = member
+        self._timer.schedule()
+
+    async def flush(self):
+        """
+        Welcomes everyone that is waiting. If that fails, they stay queued for a retry and the error is raised
+        """
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        try:
+            upcoming = {
+                guild_id: next_event(await self.events.events(guild_id))
+                for guild_id in {guild_id for guild_id, _ in pending}
+            }
+            report = await self.sender.send(
+                list(pending.values()), lambda member: welcome_message(member, upcoming[member.guild.id])
+            )
+        except Exception:
+            for key, member in pending.items():
+                self._pending.setdefault(key, member)
+            self._timer.schedule()
+            raise
+        print(f"Welcomed {len(pending)} new member(s): {report}")
+
+    async def close(self):
+        """
+        Welcomes anyone still waiting and stops the timer
+        """
+        await self._timer.close()
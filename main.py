@@ -1,95 +1,259 @@
-import asyncio
-import time
+from typing import Optional
 
 import discord
 from discord import app_commands
 
-from discordbot.commands import notification_command
-from discordbot.models.event_models import Event
-from discordbot.models.user_models import User
+from discordbot.actions.event_scheduler import DeadlineScheduler
+from discordbot.actions.leader_elector import LeaderElector
+from discordbot.actions.supervisor import Supervisor
+from discordbot.commands import command_sync, notification_command
+from discordbot.models.event_models import NOTIFIED_FLAGS, Event
+from discordbot.models.lease_models import Lease
+from discordbot.models.user_models import NotificationKind, User
 from discordbot.settings import SETTINGS
+from discordbot.store.event_debouncer import EventDebouncer
+from discordbot.store.leases import SupabaseLeaseBackend
+from discordbot.store.notification_outbox import NotificationOutbox
+from discordbot.store.scheduled_event_mirror import ScheduledEventMirror
+from discordbot.store.subscriber_index import SubscriberIndex
 from discordbot.store.supabase_manager import SupabaseManager
+from discordbot.store.write_buffer import WriteBuffer
+from discordbot.util.dm_fanout import DMFanOut
+from discordbot.util.member_resolver import MemberResolver
+from discordbot.util import notification_messages
+from discordbot.util.metrics import METRICS
 from discordbot.util.registers import SupabaseRegister
+from discordbot.util.welcome_queue import WelcomeQueue
 
 
-class DiscordClient(discord.Client):
+class LeaderCommandTree(app_commands.CommandTree):
+    """
+    Every replica receives every interaction, so only the leader answers them
+    """
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return self.client.is_leader
+
+    async def on_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        if isinstance(error, app_commands.CheckFailure):
+            return
+        await super().on_error(interaction, error)
+
+
+class DiscordClient(discord.AutoShardedClient):
     def __init__(self, intents: discord.Intents):
-        super().__init__(intents=intents, member_cache_flags=discord.MemberCacheFlags.all())
-        self.tree = app_commands.CommandTree(self)
+        # In lean mode only the members we need are requested from Discord, see MemberResolver
+        super().__init__(
+            intents=intents,
+            shard_count=SETTINGS.shard_count,
+            member_cache_flags=discord.MemberCacheFlags.none() if SETTINGS.lean_member_cache
+            else discord.MemberCacheFlags.all(),
+            chunk_guilds_at_startup=not SETTINGS.lean_member_cache
+        )
+        self.tree = LeaderCommandTree(self)
 
         # Managers handle uploading/downloading supabase data
         self.supabase_managers = SupabaseRegister()
-        self.supabase_managers[Event] = SupabaseManager("events", Event)
-        self.supabase_managers[User] = SupabaseManager("users", User)
+        self.supabase_managers[Event] = SupabaseManager(
+            "events", Event, cache_ttl=SETTINGS.supabase_cache_ttl, snapshot_path=SETTINGS.snapshot_path
+        )
+        self.supabase_managers[User] = SupabaseManager(
+            "users", User, cache_ttl=SETTINGS.supabase_cache_ttl, snapshot_path=SETTINGS.snapshot_path
+        )
+
+        # The guilds' scheduled events, kept current by the gateway so reading them needs no request
+        self.scheduled_events = ScheduledEventMirror(self)
+
+        # Gateway events can arrive in bursts, so coalesce their writes
+        self.event_writes = WriteBuffer(self.supabase_managers[Event])
+
+        # Background loops, and the one that wakes up exactly when an event needs a notification or to be started
+        self.supervisor = Supervisor()
+        self.event_scheduler = DeadlineScheduler()
+        self.event_updates = EventDebouncer(self.event_writes, self.event_scheduler)
+        self.event_action = None
+
+        # Rate limited sender for notification waves, fed from a durable outbox
+        self.dm_sender = DMFanOut()
+        self.member_resolver = MemberResolver(self)
+        self.outbox = NotificationOutbox(self.dm_sender, self.member_resolver.resolve, notification_messages.digest)
+        self.welcome_queue = WelcomeQueue(self.dm_sender, self.scheduled_events)
+
+        # With several replicas, only the one holding the leader lease runs the loops and answers Discord
+        self.leader: Optional[LeaderElector] = None
+        if SETTINGS.leader_election:
+            self.supabase_managers[Lease] = SupabaseManager("leases", Lease)
+            self.leader = LeaderElector(
+                SupabaseLeaseBackend(self.supabase_managers[Lease]),
+                on_elected=self.start_leading,
+                on_deposed=self.stop_leading
+            )
+
+        # Who wants which notifications, so waves don't need the whole users table
+        self.subscribers = SubscriberIndex(self.supabase_managers[User])
 
         # User commands
-        notification_command.register(self.tree, self.supabase_managers[User])
+        notification_command.register(self.tree, self.supabase_managers[User], self.subscribers)
+
+    @property
+    def is_leader(self) -> bool:
+        """
+        Whether this replica should send notifications and answer Discord. Always true without leader election
+        """
+        return self.leader is None or self.leader.is_leader
+
+    @property
+    def fencing_token(self) -> Optional[int]:
+        """
+        The token to fence the leader's writes with, or None without leader election
+        """
+        return self.leader.token if self.leader is not None else None
 
     async def on_ready(self):
+        # A new session may have missed gateway events, so fetch the scheduled events once more
+        self.scheduled_events.mark_stale(SETTINGS.guild_ids)
+        await self.scheduled_events.seed(SETTINGS.guild_ids)
+
+        # on_ready fires again after every reconnect, the supervisor makes sure each loop only runs once
+        if self.leader is None:
+            await self.start_leading()
+        else:
+            self.supervisor.run("LeaderElector", self.leader.run)
+
+        # Finish any notifications that were interrupted by a restart. They were all saved by this replica as
+        # the leader, so they are sent even if it isn't the leader anymore
+        self.outbox.kick()
+
+    async def wave_saved(self, event_id: str, kind: NotificationKind, token: Optional[int]) -> bool:
+        """
+        Checks whether a wave this replica queued before a restart was saved by it, so it is ours to send
+        :param token: The fencing token the wave was going to be saved with
+        :return: Whether the event's flag is set, with our token as its fence
+        :raise SupabaseUnavailable: If supabase can't be reached
+        """
+        flag = NOTIFIED_FLAGS[kind]
+        # Read past the cache and the offline snapshot, only supabase knows who saved the flag
+        rows = [row async for row in self.supabase_managers[Event].scan([flag, "fence"], filters={"id": event_id})]
+        if not rows or not rows[0][flag]:
+            return False
+        if token is None:
+            # Without a token, only a replica that never shared the flags can be sure it saved them
+            return self.leader is None
+        return rows[0]["fence"] == token
+
+    async def start_leading(self):
+        """
+        Starts the loops only the leader runs
+        """
         # Avoid circular imports
         from discordbot.actions.event_action import EventAction
 
+        if self.event_action is None:
+            self.event_action = EventAction(self)
         timers = [
-            EventAction(self)
+            self.event_action
         ]
         for timer in timers:
-            asyncio.create_task(timer.start())
+            self.supervisor.add(timer)
+        self.supervisor.run("DeadlineScheduler", lambda: self.event_scheduler.run(self.event_action.run_due))
+
+    async def stop_leading(self):
+        """
+        Stops the loops only the leader runs, once another replica may have taken over
+        """
+        if self.event_action is not None:
+            await self.supervisor.cancel(self.event_action.name)
+        await self.supervisor.cancel("DeadlineScheduler")
+
+    async def on_shard_ready(self, shard_id: int):
+        # A shard that started a new session may have missed its guilds' gateway events
+        self.scheduled_events.mark_stale(
+            guild.id for guild in self.guilds if guild.shard_id == shard_id and self.serves(guild.id)
+        )
 
     async def setup_hook(self):
+        await METRICS.start()
+
+        # Settle the notifications a crash left waiting on their flags, before any new wave is queued
+        await self.outbox.recover(self.wave_saved)
+
         print("Syncing commands")
         try:
-            synced = await self.tree.sync()
-            print(f"Synced {len(synced)} command(s)")
-            for command in synced:
-                print(f"  - {command.name}")
+            synced = await command_sync.sync_if_changed(self.tree)
+            if synced is None:
+                print("Commands have not changed since the last sync, skipping")
+            else:
+                print(f"Synced {len(synced)} command(s)")
+                for command in synced:
+                    print(f"  - {command.name}")
         except Exception as e:
             print(f"An error occurred while syncing commands: {e}")
 
-    async def on_member_join(self, member: discord.Member):
-        # Waiting 10 seconds, so we don't ping right away.
-        await asyncio.sleep(10)
-
-        content = (f"Welcome {member.mention} to **AI Society**! We're happy to have you here.\n\n"
-                   f"We have a little notification system to help keep you up to date with events. "
-                   f"If you run the command `/notifications`, you can choose to be notified about events "
-                   f"24 hours, and 1 hour before they start (We recommend turning on both).")
-
-        next_event = None
-        events = await self.supabase_managers[Event].list()
-        for event in events:
-            if event.start_time > time.time() and event.status == "scheduled":
-                next_event = event
-                break
-
-        if next_event:
-            content += (f"\n\nIt looks like we have an [event coming up]({next_event.discord_link}). "
-                        f"Make sure to check it out! Use <#1228852708677783572> if you would like to "
-                        f"ask any questions or get help.")
-        else:
-            content += "\n\nWe don't have any events coming up right now, but stay tuned!"
+    async def close(self):
+        # While we can still send DMs
+        await self.welcome_queue.close()
+        await super().close()
+        await self.supervisor.stop()
+        if self.leader is not None:
+            await self.leader.release()
+        await METRICS.stop()
+        self.outbox.close()
+        await self.event_updates.close()
+        await self.event_writes.close()
+        await self.supabase_managers.close()
 
-        await member.send(content=content)
+    @staticmethod
+    def serves(guild_id: int) -> bool:
+        """
+        Whether the bot looks after the given guild
+        """
+        return guild_id in SETTINGS.guild_ids
+
+    async def on_member_join(self, member: discord.Member):
+        if not self.serves(member.guild.id) or not self.is_leader:
+            return
+        self.welcome_queue.add(member)
 
     async def on_scheduled_event_create(self, scheduled_event: discord.ScheduledEvent):
+        if not self.serves(scheduled_event.guild_id):
+            return
+        # Every replica keeps its mirror current, so a standby can take over without fetching anything
+        scheduled_event = self.scheduled_events.put(scheduled_event)
+        if not self.is_leader:
+            return
         print(f"Sending event '{scheduled_event.name}' to supabase")
-        await self.update_and_upsert_event(scheduled_event)
+        self.event_updates.update(scheduled_event)
 
     async def on_scheduled_event_update(self, before: discord.ScheduledEvent, after: discord.ScheduledEvent):
-        print(f"Updating event '{before.name}' in supabase")
-        await self.update_and_upsert_event(after)
+        if not self.serves(after.guild_id):
+            return
+        after = self.scheduled_events.put(after)
+        if not self.is_leader:
+            return
+        self.event_updates.update(after)
 
-    async def on_scheduled_event_remove(self, scheduled_event: discord.ScheduledEvent):
+    async def on_scheduled_event_delete(self, scheduled_event: discord.ScheduledEvent):
+        if not self.serves(scheduled_event.guild_id):
+            return
+        self.scheduled_events.remove(scheduled_event)
+        if not self.is_leader:
+            return
         print(f"Removing event '{scheduled_event.name}' from supabase")
-        await self.supabase_managers[Event].remove(str(scheduled_event.id))
+        self.event_updates.remove(scheduled_event)
 
-    async def update_and_upsert_event(self, event: discord.ScheduledEvent):
-        previous_event = await self.supabase_managers[Event].query(str(event.id))
-        if previous_event:
-            previous_event.update(event)
-            await self.supabase_managers[Event].upsert(previous_event)
-        else:
-            converted_event = Event.from_scheduled_event(event)
-            await self.supabase_managers[Event].upsert(converted_event)
+    async def on_scheduled_event_user_add(self, scheduled_event: discord.ScheduledEvent, user: discord.User):
+        await self._count_users(scheduled_event, 1)
+
+    async def on_scheduled_event_user_remove(self, scheduled_event: discord.ScheduledEvent, user: discord.User):
+        await self._count_users(scheduled_event, -1)
+
+    async def _count_users(self, scheduled_event: discord.ScheduledEvent, count: int):
+        if not self.serves(scheduled_event.guild_id):
+            return
+        mirrored = self.scheduled_events.add_users(scheduled_event, count)
+        if mirrored is None or not self.is_leader:
+            return
+        self.event_updates.update(mirrored)
 
 
 def main():
@@ -0,0 +1,58 @@
+import datetime
+import time
+import unittest
+
+import benchmarks  # noqa: F401, loads settings without a .env
+from benchmarks.bench_suite import Harness
+from discordbot.actions.event_action import EventAction
+from discordbot.models.event_models import Event
+
+
+class EventActionTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.harness = await Harness(users=9, events=5, latency=0).__aenter__()
+        self.client = self.harness.client
+        self.action = EventAction(self.client)
+
+    async def asyncTearDown(self):
+        await self.harness.__aexit__(None, None, None)
+
+    async def test_notifies_about_an_event_still_waiting_to_be_written(self):
+        # The last event isn't stored yet, and starts soon enough for its 24 hour notification
+        scheduled_event = self.harness.guild.scheduled_events[-1]
+        scheduled_event.start_time = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=12)
+        await self.client.on_scheduled_event_create(scheduled_event)
+        await self.client.event_updates.flush()
+        self.assertIsNotNone(self.client.event_writes.pending(str(scheduled_event.id)))
+
+        await self.action.run_due({str(scheduled_event.id)})
+
+        row = self.harness.server.tables["events"][str(scheduled_event.id)]
+        self.assertTrue(row["already_notified_24_hours"])
+        self.assertEqual([], self.client.outbox.held_waves())
+        self.assertEqual(3, self.client.outbox.pending_count())
+
+    async def test_notifies_even_when_an_event_fails_to_start(self):
+        due, late = self.harness.guild.scheduled_events[:2]
+
+        async def refuse():
+            raise ConnectionError("discord is down")
+
+        late.start = refuse
+        late_event = Event.from_scheduled_event(late)
+        late_event.start_time = time.time() - 60
+        late_event.already_notified_24_hours = late_event.already_notified_1_hours = True
+        due_event = await self.client.supabase_managers[Event].query(str(due.id))
+
+        await self.action.process_events([late_event, due_event], {late_event.id: late, due_event.id: due})
+
+        row = self.harness.server.tables["events"][due_event.id]
+        self.assertTrue(row["already_notified_24_hours"])
+        self.assertTrue(row["already_notified_1_hours"])
+        self.assertEqual([], self.client.outbox.held_waves())
+        # Not marked as started, so the next pass tries again
+        self.assertEqual("scheduled", late_event.status)
+
+
+if __name__ == "__main__":
+    unittest.main()
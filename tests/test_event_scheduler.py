@@ -0,0 +1,67 @@
+import asyncio
+import time
+import unittest
+
+from discordbot.actions.event_scheduler import DeadlineScheduler
+
+
+class DeadlineSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    async def run_scheduler(self, scheduler: DeadlineScheduler, callback, seconds: float = 0.2):
+        task = asyncio.create_task(scheduler.run(callback))
+        await asyncio.sleep(seconds)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    async def test_reaches_due_deadlines(self):
+        scheduler = DeadlineScheduler()
+        calls = []
+
+        async def callback(keys):
+            calls.append(keys)
+
+        scheduler.schedule("past", [time.time() - 60])
+        scheduler.schedule("soon", [time.time() + 0.05])
+        scheduler.schedule("later", [time.time() + 60])
+        await self.run_scheduler(scheduler, callback)
+
+        self.assertEqual([{"past"}, {"soon"}], calls)
+
+    async def test_deadlines_put_back_are_not_reached_again(self):
+        scheduler = DeadlineScheduler()
+        deadlines = [time.time() - 60, time.time() + 60]
+        calls = []
+
+        async def callback(keys):
+            calls.append(keys)
+            for key in keys:
+                # Like an event that couldn't be handled, so its deadlines are unchanged
+                scheduler.schedule(key, deadlines)
+
+        scheduler.schedule("event", deadlines)
+        other_task_ran = asyncio.Event()
+        asyncio.get_running_loop().call_soon(other_task_ran.set)
+        await self.run_scheduler(scheduler, callback)
+
+        self.assertEqual([{"event"}], calls)
+        self.assertTrue(other_task_ran.is_set())
+        self.assertEqual({"event"}, scheduler.keys())
+
+    async def test_cancel_forgets_that_a_key_was_reached(self):
+        scheduler = DeadlineScheduler()
+        deadline = time.time() - 60
+        calls = []
+
+        async def callback(keys):
+            calls.append(keys)
+
+        scheduler.schedule("event", [deadline])
+        await self.run_scheduler(scheduler, callback)
+        scheduler.cancel("event")
+        scheduler.schedule("event", [deadline])
+        await self.run_scheduler(scheduler, callback)
+
+        self.assertEqual([{"event"}, {"event"}], calls)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import asyncio
+import unittest
+
+import benchmarks  # noqa: F401, loads settings without a .env
+from benchmarks.fake_discord import FakeGuild
+from benchmarks.fake_postgrest import FakePostgrest
+from discordbot.actions.leader_elector import LeaderElector
+from discordbot.models.event_models import Event
+from discordbot.store.leases import MemoryLeaseBackend
+from discordbot.store.supabase_manager import SupabaseManager
+from discordbot.store.supabase_pool import SupabaseClientPool
+
+API_KEY = "test.test.test"
+TTL = 0.09
+
+
+class UnreachableLeaseBackend(MemoryLeaseBackend):
+    """
+    Grants leases until it is cut off
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.reachable = True
+
+    async def acquire(self, name, holder, ttl):
+        if not self.reachable:
+            raise ConnectionError("supabase is down")
+        return await super().acquire(name, holder, ttl)
+
+
+class LeaderElectorTest(unittest.IsolatedAsyncioTestCase):
+    async def test_standby_takes_over_an_expired_lease(self):
+        backend = MemoryLeaseBackend()
+        deposed = []
+
+        async def on_deposed():
+            deposed.append("a")
+
+        leader = LeaderElector(backend, holder="a", ttl=TTL, on_deposed=on_deposed)
+        standby = LeaderElector(backend, holder="b", ttl=TTL)
+
+        await leader.step()
+        await standby.step()
+        self.assertEqual(1, leader.token)
+        self.assertFalse(standby.is_leader)
+
+        # The leader stops renewing
+        await asyncio.sleep(TTL)
+        await standby.step()
+        self.assertEqual(2, standby.token)
+
+        await leader.step()
+        self.assertFalse(leader.is_leader)
+        self.assertEqual(["a"], deposed)
+
+    async def test_leader_steps_down_when_it_cannot_renew(self):
+        backend = UnreachableLeaseBackend()
+        leader = LeaderElector(backend, holder="a", ttl=TTL)
+        await leader.step()
+
+        backend.reachable = False
+        await leader.step()
+        # The lease may still be ours for a while
+        self.assertEqual(1, leader.token)
+
+        await asyncio.sleep(TTL - leader.renew_interval)
+        await leader.step()
+        self.assertIsNone(leader.token)
+
+    async def test_write_with_a_stale_token_is_rejected(self):
+        server = FakePostgrest()
+        await server.start()
+        pool = SupabaseClientPool(server.url, API_KEY)
+        manager = SupabaseManager("events", Event, api_url=server.url, api_key=API_KEY, pool=pool)
+        event = Event.from_scheduled_event(FakeGuild(member_count=1, event_count=1).scheduled_events[0])
+        server.seed("events", [event.model_dump(mode="json")])
+
+        backend = MemoryLeaseBackend()
+        old_leader = LeaderElector(backend, holder="a", ttl=TTL)
+        await old_leader.step()
+        stale_token = old_leader.token
+        await asyncio.sleep(TTL)
+        new_leader = LeaderElector(backend, holder="b", ttl=TTL)
+        await new_leader.step()
+
+        saved = await manager.patch_fenced(event.id, {"already_notified_24_hours": True}, new_leader.token)
+        rejected = await manager.patch_fenced(event.id, {"already_notified_24_hours": False}, stale_token)
+
+        self.assertIsNotNone(saved)
+        self.assertIsNone(rejected)
+        self.assertTrue(server.tables["events"][event.id]["already_notified_24_hours"])
+        self.assertEqual(2, server.tables["events"][event.id]["fence"])
+        await pool.close()
+        await server.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
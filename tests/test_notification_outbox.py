@@ -0,0 +1,76 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+import benchmarks  # noqa: F401, loads settings without a .env
+from benchmarks.fake_discord import FakeGuild
+from discordbot.store.notification_outbox import NotificationOutbox
+from discordbot.util.dm_fanout import DMFanOut
+from discordbot.util import notification_messages
+
+
+class NotificationOutboxTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "outbox.sqlite3")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def outbox(self) -> NotificationOutbox:
+        return NotificationOutbox(None, None, notification_messages.digest, path=self.path)
+
+    async def test_restart_keeps_held_jobs_until_recovered(self):
+        outbox = self.outbox()
+        outbox.enqueue(1, "saved", "is_ping_day_before", [1, 2], "content", "line", held=True, token=7)
+        outbox.enqueue(1, "unsaved", "is_ping_day_before", [1, 2], "content", "line", held=True, token=7)
+        outbox.enqueue(1, "unknown", "is_ping_day_before", [1, 2], "content", "line", held=True, token=7)
+        outbox.close()
+
+        outbox = self.outbox()
+        self.assertEqual(0, outbox.pending_count())
+
+        async def saved(event_id, kind, token):
+            if event_id == "unknown":
+                raise ConnectionError("supabase is down")
+            return event_id == "saved" and token == 7
+
+        await outbox.recover(saved)
+
+        self.assertEqual(2, outbox.pending_count())
+        self.assertEqual([("unknown", "is_ping_day_before", 7)], outbox.held_waves())
+        # A discarded wave can be queued again by the leader's next pass
+        self.assertEqual(2, outbox.enqueue(1, "unsaved", "is_ping_day_before", [1, 2], "content", "line"))
+        outbox.close()
+
+    async def test_a_failing_guild_is_retried_without_holding_up_the_others(self):
+        guilds = {1: FakeGuild(member_count=2, event_count=0, guild_id=1),
+                  2: FakeGuild(member_count=2, event_count=0, guild_id=2)}
+        failures = [ConnectionError("discord is down")]
+
+        async def resolve(guild_id, user_ids):
+            if guild_id == 1 and failures:
+                raise failures.pop()
+            return {user_id: guilds[guild_id].get_member(user_id) for user_id in user_ids}
+
+        outbox = NotificationOutbox(
+            DMFanOut(), resolve, notification_messages.digest, path=self.path, digest_window=0, retry_delay=0.05
+        )
+        for guild_id in guilds:
+            outbox.enqueue(guild_id, f"event {guild_id}", "is_ping_day_before", [1, 2], "content", "line")
+
+        outbox.kick()
+        await asyncio.sleep(0.01)
+        self.assertEqual(0, guilds[1].requests["send_dm"])
+        self.assertEqual(2, guilds[2].requests["send_dm"])
+        self.assertEqual(2, outbox.pending_count())
+
+        await asyncio.sleep(0.1)
+        self.assertEqual(2, guilds[1].requests["send_dm"])
+        self.assertEqual(0, outbox.pending_count())
+        outbox.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import tempfile
+import unittest
+
+from discord import app_commands
+
+import benchmarks  # noqa: F401, loads settings without a .env
+from benchmarks.fake_discord import FakeGuild, FakeInteraction
+from benchmarks.fake_postgrest import FakePostgrest
+from discordbot.commands.notification_command import set_notification
+from discordbot.models.user_models import User
+from discordbot.store.subscriber_index import SubscriberIndex
+from discordbot.store.supabase_manager import SupabaseManager
+from discordbot.store.supabase_pool import SupabaseClientPool
+
+API_KEY = "test.test.test"
+
+
+class SubscriberIndexTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.snapshot_path = os.path.join(self.directory.name, "snapshot.sqlite3")
+        self.server = FakePostgrest()
+        await self.server.start()
+        self.server.seed("users", [
+            User(id=User.key(1, user_id), guild_id="1", is_ping_hour_before=user_id % 2 == 0).model_dump(mode="json")
+            for user_id in range(10)
+        ])
+
+    async def asyncTearDown(self):
+        await self.server.stop()
+        self.directory.cleanup()
+
+    def manager(self, api_url: str, pool: SupabaseClientPool) -> SupabaseManager[User]:
+        return SupabaseManager(
+            "users", User, api_url=api_url, api_key=API_KEY, pool=pool, cache_ttl=60, snapshot_path=self.snapshot_path
+        )
+
+    async def test_cold_start_while_offline_uses_the_snapshot(self):
+        pool = SupabaseClientPool(self.server.url, API_KEY)
+        online = SubscriberIndex(self.manager(self.server.url, pool))
+        await online.refresh()
+        await pool.close()
+        online.manager.snapshot.close()
+
+        # A restart while supabase can't be reached
+        unreachable = "http://127.0.0.1:1"
+        pool = SupabaseClientPool(unreachable, API_KEY)
+        offline = SubscriberIndex(self.manager(unreachable, pool))
+
+        subscribers = await offline.subscribers(1, "is_ping_hour_before")
+
+        self.assertEqual({0, 2, 4, 6, 8}, subscribers)
+        await pool.close()
+        offline.manager.snapshot.close()
+
+    async def test_refresh_applies_changes(self):
+        pool = SupabaseClientPool(self.server.url, API_KEY)
+        index = SubscriberIndex(self.manager(self.server.url, pool))
+        await index.refresh()
+
+        await index.manager.patch(User.key(1, 1), {"is_ping_hour_before": True})
+        await index.manager.remove(User.key(1, 2))
+        await index.refresh()
+
+        self.assertEqual({0, 1, 4, 6, 8}, await index.subscribers(1, "is_ping_hour_before"))
+        await pool.close()
+        index.manager.snapshot.close()
+
+    async def test_toggle_negates_the_stored_setting(self):
+        pool = SupabaseClientPool(self.server.url, API_KEY)
+        index = SubscriberIndex(self.manager(self.server.url, pool))
+        member = FakeGuild(member_count=1, event_count=0).get_member(1)
+
+        toggles = [
+            await set_notification(FakeInteraction(member), "is_ping_hour_before", None, index.manager, index)
+            for _ in range(2)
+        ]
+
+        self.assertEqual([True, False], toggles)
+
+        self.assertFalse(self.server.tables["users"][User.key(1, 1)]["is_ping_hour_before"])
+        self.assertEqual(2, self.server.requests[("POST", "rpc/toggle_user_setting")])
+        self.assertEqual({0, 2, 4, 6, 8}, await index.subscribers(1, "is_ping_hour_before"))
+        await pool.close()
+        index.manager.snapshot.close()
+
+    async def test_stale_refresh_keeps_a_toggle(self):
+        pool = SupabaseClientPool(self.server.url, API_KEY)
+        index = SubscriberIndex(self.manager(self.server.url, pool))
+        await index.refresh()
+        member = FakeGuild(member_count=1, event_count=0).get_member(1)
+        off = app_commands.Choice(name="off", value=0)
+        await set_notification(FakeInteraction(member), "is_ping_hour_before", off, index.manager, index)
+
+        # The member toggles while a refresh is reading the change before it
+        list_since = index.manager.list_since
+
+        async def toggle_while_reading(since: float):
+            delta = await list_since(since)
+            await set_notification(FakeInteraction(member), "is_ping_hour_before", None, index.manager, index)
+            return delta
+
+        index.manager.list_since = toggle_while_reading
+        await index.refresh()
+
+        self.assertIn(1, await index.subscribers(1, "is_ping_hour_before"))
+        await pool.close()
+        index.manager.snapshot.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
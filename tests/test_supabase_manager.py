@@ -0,0 +1,82 @@
+import os
+import tempfile
+import time
+import unittest
+
+import benchmarks  # noqa: F401, loads settings without a .env
+from benchmarks.fake_postgrest import FakePostgrest
+from discordbot.models.user_models import User
+from discordbot.store.supabase_manager import SupabaseManager
+from discordbot.store.supabase_pool import SupabaseClientPool
+
+API_KEY = "test.test.test"
+
+
+class SupabaseManagerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = FakePostgrest(max_rows=10)
+        await self.server.start()
+        self.pool = SupabaseClientPool(self.server.url, API_KEY)
+        self.manager = SupabaseManager(
+            "users", User, api_url=self.server.url, api_key=API_KEY, pool=self.pool, page_size=10
+        )
+        self.server.seed("users", [
+            User(id=User.key(1, user_id), guild_id="1", is_ping_hour_before=user_id % 2 == 0).model_dump(mode="json")
+            for user_id in range(25)
+        ])
+
+    async def asyncTearDown(self):
+        await self.pool.close()
+        await self.server.stop()
+
+    async def test_list_ids_reads_past_the_row_cap(self):
+        ids = await self.manager.list_ids(is_ping_hour_before=True)
+
+        self.assertEqual(sorted(User.key(1, user_id) for user_id in range(0, 25, 2)), sorted(ids))
+
+    async def test_list_reads_past_the_row_cap(self):
+        users = await self.manager.list()
+
+        self.assertEqual(25, len(users))
+
+    async def test_replay_sets_rejected_writes_aside(self):
+        with tempfile.TemporaryDirectory() as directory:
+            manager = SupabaseManager(
+                "users", User, api_url=self.server.url, api_key=API_KEY, pool=self.pool, chunk_size=10, page_size=10,
+                snapshot_path=os.path.join(directory, "snapshot.sqlite3")
+            )
+            manager.snapshot.queue_upserts([
+                User(id=User.key(2, user_id), guild_id="2").model_dump(mode="json") for user_id in range(25)
+            ])
+            self.server.rejected_ids.add(User.key(2, 3))
+
+            ids = await manager.list_ids(guild_id="2")
+
+            self.assertEqual(sorted(User.key(2, user_id) for user_id in range(25) if user_id != 3), sorted(ids))
+            self.assertFalse(manager.snapshot.has_pending_writes())
+            manager.snapshot.close()
+
+    async def test_patch_while_offline_only_replays_the_patched_columns(self):
+        key = User.key(1, 3)
+        self.server.tables["users"][key]["is_ping_day_before"] = True
+        with tempfile.TemporaryDirectory() as directory:
+            manager = SupabaseManager(
+                "users", User, api_url=self.server.url, api_key=API_KEY, pool=self.pool,
+                snapshot_path=os.path.join(directory, "snapshot.sqlite3")
+            )
+            manager._offline_until = time.monotonic() + 60
+
+            patched = await manager.patch(key, {"guild_id": "1", "is_ping_hour_before": True})
+            manager._offline_until = 0
+            await manager.query(User.key(1, 0))
+
+            self.assertTrue(patched.is_ping_hour_before)
+            row = self.server.tables["users"][key]
+            self.assertTrue(row["is_ping_hour_before"])
+            self.assertTrue(row["is_ping_day_before"])
+            self.assertFalse(manager.snapshot.has_pending_writes())
+            manager.snapshot.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
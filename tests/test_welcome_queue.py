@@ -0,0 +1,50 @@
+import asyncio
+import unittest
+
+import benchmarks  # noqa: F401, loads settings without a .env
+from benchmarks.fake_discord import FakeGuild
+from discordbot.util.dm_fanout import DMFanOut
+from discordbot.util.welcome_queue import WelcomeQueue
+
+
+class FlakyEvents:
+    """
+    Stands in for the scheduled event mirror, failing the first lookup
+    """
+
+    def __init__(self):
+        self.failures = [ConnectionError("discord is down")]
+
+    async def events(self, guild_id: int):
+        if self.failures:
+            raise self.failures.pop()
+        return []
+
+
+class WelcomeQueueTest(unittest.IsolatedAsyncioTestCase):
+    async def test_failed_flush_keeps_the_members_for_a_retry(self):
+        guild = FakeGuild(member_count=3, event_count=0)
+        queue = WelcomeQueue(DMFanOut(), FlakyEvents(), window=0.01)
+        for member in guild.members:
+            queue.add(member)
+
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(3, guild.requests["send_dm"])
+        await queue.close()
+
+    async def test_close_welcomes_the_members_still_waiting(self):
+        guild = FakeGuild(member_count=3, event_count=0)
+        events = FlakyEvents()
+        events.failures.clear()
+        queue = WelcomeQueue(DMFanOut(), events, window=60)
+        for member in guild.members:
+            queue.add(member)
+
+        await queue.close()
+
+        self.assertEqual(3, guild.requests["send_dm"])
+
+
+if __name__ == "__main__":
+    unittest.main()